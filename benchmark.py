@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from contextlib import redirect_stdout
+import numpy as np
+import plotly
+from src import CSV
+from src import Plotter
+from src import profiler
+from runme import get_arguments, get_csv_list, generate_plots
+
+# Rows generated (and formatted) at a time, so generating a large file needs little memory
+GENERATE_CHUNK_ROWS = 100000
+# runme.py options used if none are given after "--"
+DEFAULT_RUNME_ARGS = ['-c', 'val-*', '--xaxis', 'timestamp', '--sum', '-S', '0.5', '-o', '1']
+
+
+def generate_csv(fname, rows, cols, bad_every=1000, si_fraction=0.05, seed=0):
+    """
+    Writes a synthetic CSV: comment lines before the header, then a "timestamp" column and cols "val-N" columns of
+    random values. About si_fraction of the values have an SI suffix (e.g. "12.5K"), and every bad_every rows there
+    is a row with a missing field, a comment and a blank line (which are all skipped when parsing).
+    """
+    rng = np.random.default_rng(seed)
+    with open(fname, 'w') as csv_file:
+        csv_file.write("# Synthetic benchmark data\n# rows={} cols={}\n".format(rows, cols))
+        csv_file.write(",".join(["timestamp"] + ["val-{}".format(col) for col in range(cols)]) + "\n")
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            num = min(GENERATE_CHUNK_ROWS, rows - start)
+            values = rng.uniform(0, 100, (num, cols)).round(3).astype(str)
+            si_cells = rng.random((num, cols)) < si_fraction
+            values[si_cells] = np.char.add(values[si_cells], 'K')
+            lines = [",".join(row) for row in zip(np.arange(start, start + num).astype(str), *values.T)]
+            for line in range(bad_every - start % bad_every - 1, num, bad_every) if bad_every else []:
+                lines[line] += "\n{}\n# marker\n".format(",".join(lines[line].split(",")[:-1]))
+            csv_file.write("\n".join(lines) + "\n")
+
+
+def get_data_files(data_dir, files, rows, cols, bad_every):
+    """
+    Generates the synthetic CSVs, unless files with the same parameters are already in data_dir.
+    """
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    fpaths = []
+    for num in range(files):
+        fpath = os.path.join(data_dir, "synth_{}x{}_bad{}_{}.csv".format(rows, cols, bad_every, num))
+        if not os.path.exists(fpath):
+            generate_csv(fpath, rows, cols, bad_every, seed=num)
+        fpaths.append(fpath)
+    return fpaths
+
+
+def get_peak_rss_mb():
+    """
+    Returns the peak resident memory of this process so far in MB, or None if it can't be measured (e.g. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_pipeline(args, rows):
+    """
+    Parses the files and generates the plot(s) like runme.py (once, even with --follow), and returns the wall time,
+    rows/sec and peak RSS of each stage recorded by the profiler (see profiler.stage), in the order the stages first
+    ran. Every option is used as by runme.py (e.g. --chunk_rows, --resample, --rolling or --jobs), so only the stages
+    that the options run are listed.
+    The time of a stage is its total over all files. rows is the total number of (valid) rows in all files, used for
+    throughput.
+    """
+    stages = dict()
+
+    def record_stage(record):
+        stage = stages.setdefault(record['stage'], dict(stage=record['stage'], seconds=0.0))
+        stage['seconds'] = round(stage['seconds'] + record['wall_s'], 6)
+        stage['rows_per_sec'] = round(rows / stage['seconds']) if stage['seconds'] else None
+        stage['peak_rss_mb'] = get_peak_rss_mb()
+
+    # Memory isn't traced, since tracemalloc would slow every stage down
+    profiler.enable(trace_memory=False).add_hook(record_stage)
+    try:
+        generate_plots(args, get_csv_list(args))
+    finally:
+        profiler.disable()
+    return list(stages.values())
+
+
+def get_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return output.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(bench_args, runme_args):
+    """
+    Generates (or reuses) the synthetic files, then runs the pipeline bench_args.repeat times.
+    Returns the report: the parameters, and the fastest time of each stage over all runs.
+    """
+    fpaths = get_data_files(bench_args.data_dir, bench_args.files, bench_args.rows, bench_args.cols,
+                            bench_args.bad_every)
+    args = get_arguments(['-f', ','.join(fpaths), '-D', bench_args.out_dir] + (runme_args or DEFAULT_RUNME_ARGS))
+    runs = []
+    for run in range(bench_args.repeat):
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            runs.append(run_pipeline(args, bench_args.rows * bench_args.files))
+    stages = [min(stage_runs, key=lambda stage: stage['seconds']) for stage_runs in zip(*runs)]
+    return dict(
+        commit=get_commit(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        plotly=plotly.__version__,
+        rows=bench_args.rows, cols=bench_args.cols, files=bench_args.files, bad_every=bench_args.bad_every,
+        bytes=sum([os.path.getsize(fpath) for fpath in fpaths]),
+        runme_args=runme_args or DEFAULT_RUNME_ARGS,
+        repeat=bench_args.repeat,
+        stages=stages,
+        total_seconds=round(sum([stage['seconds'] for stage in stages]), 6),
+        peak_rss_mb=get_peak_rss_mb(),
+    )
+
+
+def run_trace_benchmark(trace_counts, rows=100, cols_per_file=50, repeat=3):
+    """
+    Times figure construction (Plotter.create_figure) for each number of traces in trace_counts, using in-memory
+    columns (cols_per_file per CSV, rows each), so parsing isn't part of the measurement.
+    Returns one result per count, with the time per trace so that the scaling can be checked.
+    """
+    rng = np.random.default_rng(0)
+    args = get_arguments(['-f', 'synthetic.csv', '-c', 'val-*', '--xaxis', 'timestamp', '-u'])
+    results = []
+    for count in trace_counts:
+        sizes = [cols_per_file] * (count // cols_per_file) + ([count % cols_per_file] if count % cols_per_file else [])
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            csv_list = []
+            for num, cols in enumerate(sizes):
+                data = {"val-{}".format(col): rng.uniform(0, 100, rows) for col in range(cols)}
+                data["timestamp"] = np.arange(rows, dtype=np.float64)
+                csv_list.append(CSV(os.path.join("synthetic", "file_{}.csv".format(num)), args, data=data))
+            plot = Plotter(args, csv_list)
+            seconds = []
+            for run in range(repeat):
+                start = time.perf_counter()
+                plot.create_figure()
+                seconds.append(time.perf_counter() - start)
+        results.append(dict(traces=count, files=len(sizes), seconds=round(min(seconds), 6),
+                            us_per_trace=round(min(seconds) / count * 1e6, 2)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of runme.py on synthetic .csv files, and print the "
+                                                 "results as JSON. runme.py options can be given after \"--\", e.g. "
+                                                 "\"python3 benchmark.py --rows 100000 -- -c val-1 --xaxis timestamp\"")
+    parser.add_argument("--rows", help="rows per file (default is 1000000)", type=int, default=1000000)
+    parser.add_argument("--cols", help="value columns per file (default is 8)", type=int, default=8)
+    parser.add_argument("--files", help="number of files (default is 2)", type=int, default=2)
+    parser.add_argument("--bad_every", help="add a bad row, comment and blank line every this many rows (default is "
+                                            "1000, 0 disables)", type=int, default=1000)
+    parser.add_argument("--repeat", help="run the pipeline this many times and keep the fastest time of each stage "
+                                         "(default is 3)", type=int, default=3)
+    parser.add_argument("--data_dir", help="where synthetic files are generated and reused from (default is "
+                                           "\"benchmark_data\")", default="benchmark_data")
+    parser.add_argument("--out_dir", help="output directory for the plots (default is \"benchmark_data/plots\")",
+                        default=os.path.join("benchmark_data", "plots"))
+    parser.add_argument("--trace_counts", help="instead, time only figure construction for each of these "
+                                               "comma-separated numbers of traces, e.g. \"1000,10000,60000\"")
+    parser.add_argument("-O", "--output", help="also write the JSON report to this file")
+    argv = sys.argv[1:]
+    runme_args = argv[argv.index('--') + 1:] if '--' in argv else []
+    bench_args = parser.parse_args(argv[:argv.index('--')] if '--' in argv else argv)
+    if bench_args.trace_counts:
+        trace_counts = [int(count) for count in bench_args.trace_counts.split(',')]
+        results = run_trace_benchmark(trace_counts, repeat=bench_args.repeat)
+        report = json.dumps(dict(commit=get_commit(), plotly=plotly.__version__, figure=results), indent=2)
+    else:
+        report = json.dumps(run_benchmark(bench_args, runme_args), indent=2)
+    print(report)
+    if bench_args.output:
+        with open(bench_args.output, 'w') as report_file:
+            report_file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import sys
+import json
+import argparse
+from src import CSV
+from src import Plotter
+from src.predicate import RowFilter
+from src.readers import open_reader
+from runme import get_arguments, get_csv_paths, drop_empty_csvs, generate_individual_plots
+
+
+def load_manifest(fname):
+    """
+    Loads a JSON (or YAML, if PyYAML is installed) manifest. EXAMPLE:
+    {
+        "dir": "example_csv_files/my_examples",
+        "args": ["--xaxis", "timestamp", "-D", "plots/pets"],
+        "plots": [
+            {"args": ["-c", "hunger", "-n", "hunger"]},
+            {"args": ["-c", "hunger", "--col_eq_val", "name=buttons", "-t", "Buttons", "-n", "buttons"]}
+        ]
+    }
+    "dir" or "file" work like -d/-f, "args" are used for every plot, and each plot adds its own runme.py args.
+    """
+    try:
+        with open(fname) as manifest_file:
+            if fname.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    print("Reading YAML manifests requires PyYAML - install it with \"pip3 install pyyaml\". Aborting.")
+                    sys.exit(0)
+                manifest = yaml.safe_load(manifest_file)
+            else:
+                manifest = json.load(manifest_file)
+    except (OSError, ValueError) as error:
+        print("Could not read manifest {}: {}\nAborting.".format(fname, error))
+        sys.exit(0)
+    if not (manifest.get('dir') or manifest.get('file')) or not manifest.get('plots'):
+        print("The manifest needs \"dir\" or \"file\", and a list of \"plots\". Aborting.")
+        sys.exit(0)
+    return manifest
+
+
+def get_plot_args(manifest):
+    """
+    Returns the parsed runme.py args of every plot in the manifest.
+    """
+    data = ['-d', manifest['dir']] if manifest.get('dir') else ['-f', manifest['file']]
+    common = [str(x) for x in manifest.get('args', [])]
+    return [get_arguments(data + common + [str(x) for x in plot.get('args', [])]) for plot in manifest['plots']]
+
+
+def parse_shared(fpath, plot_args, reader_name):
+    """
+    Reads a file ONCE for all plots: the union of the columns that any plot uses, plus the raw text of every column
+    that any plot filters on. Files without a header have no columns (and are skipped by every plot).
+    """
+    with open_reader(fpath, reader_name) as reader:
+        header = reader.header
+    if header is None:
+        print("{} does not contain a header.".format(fpath))
+        return None, dict(), dict()
+    fields, text_fields = set(), set()
+    for args in plot_args:
+        fields.update(CSV.get_fields_to_use(args, header))
+        if args.col_eq_val:
+            text_fields.update([header[idx] for idx in RowFilter(args.col_eq_val, header).indices])
+    return CSV.read_columns(fpath, reader_name, sorted(fields), sorted(text_fields))
+
+
+def derive_csv(fpath, shared, args):
+    """
+    Creates the CSV used by one plot from the shared columns: applies its filter and takes its columns.
+    Col operations and modifiers are then applied as usual.
+    """
+    header, numeric, text = shared
+    if header is None:
+        return CSV(fpath, args, data=dict())
+    data = {field: numeric[field] for field in CSV.get_fields_to_use(args, header)}
+    if args.col_eq_val:
+        row_filter = RowFilter(args.col_eq_val, header)
+        mask = row_filter.mask({idx: text[header[idx]] for idx in row_filter.indices})
+        data = {field: values[mask] for field, values in data.items()}
+    return CSV(fpath, args, data=data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many plots from one manifest, parsing each .csv only once.")
+    parser.add_argument("manifest", help="JSON (or YAML) file listing the plots to generate")
+    manifest = load_manifest(parser.parse_args(sys.argv[1:]).manifest)
+    plot_args = get_plot_args(manifest)
+    fpaths = get_csv_paths(plot_args[0])
+    shared = {fpath: parse_shared(fpath, plot_args, plot_args[0].reader) for fpath in fpaths}
+    for num, args in enumerate(plot_args):
+        print("===== PLOT {} of {} =====".format(num + 1, len(plot_args)))
+        csv_list = drop_empty_csvs([derive_csv(fpath, shared[fpath], args) for fpath in fpaths])
+        if len(csv_list) == 0:
+            print("CSV list is empty for this plot, make sure you aren't filtering everything. Skipping.\n")
+        elif args.indiv:
+            generate_individual_plots(args, csv_list)
+        else:
+            Plotter(args, csv_list).generate_plot()
+
+
+if __name__ == "__main__":
+    main()
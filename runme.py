@@ -1,31 +1,32 @@
 import os
 import sys
+import time
 import glob
 import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from src import CSV
 from src import Plotter
+from src import profiler
+from src.downsample import MIN_POINTS
+from src.readers import FORMATS
+from src.render import export_images
 
 
 def get_csv_list(args):
-    csv_list = []
-    if args.dir:
-        for directory in parse_arg_dirfile_list(args.dir):
-            for fname in os.listdir(directory):
-                if fname.endswith(".csv"):
-                    fpath = os.path.join(directory, fname)
-                    csv = CSV(fpath, args)
-                    if True not in [len(row) > 0 for col, row in csv.data.items()]:
-                        print("{} doesn't contain data. Skipping.".format(fpath))
-                    else:
-                        csv_list.append(csv)
+    with profiler.stage('glob'):
+        fpaths = get_csv_paths(args)
+    # Parse in a process pool if requested. Results come back in the same (sorted) order as fpaths, with the stages
+    # profiled in each worker (if --profile is used), which are merged into this process' report.
+    if args.jobs and args.jobs > 1 and len(fpaths) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(fpaths))) as pool:
+            parsed = profiler.collect(pool.map(profiler.run_in_worker, itertools.repeat(profiler.get_trace_memory()),
+                                               itertools.repeat(CSV), fpaths, itertools.repeat(args)))
     else:
-        for fname in parse_arg_dirfile_list(args.file):
-            if fname.endswith(".csv"):
-                csv = CSV(fname, args)
-                if True not in [len(row) > 0 for col, row in csv.data.items()]:
-                    print("{} doesn't contain data. Skipping.".format(fname))
-                else:
-                    csv_list.append(csv)
+        parsed = [CSV(fpath, args) for fpath in fpaths]
+    # With --follow, files without rows yet (e.g. only a header, or rows held back by --resample) are kept, since rows
+    # may still be appended to them. They are only left out of the plots (see generate_plots).
+    csv_list = parsed if args.follow else drop_empty_csvs(parsed)
     if len(csv_list) == 0:
         print("CSV list is empty. Check that -d/-f are valid, and make sure you aren't filtering everything.")
         print("Aborting.")
@@ -33,6 +34,35 @@ def get_csv_list(args):
     return csv_list
 
 
+def drop_empty_csvs(parsed):
+    csv_list = []
+    for csv in parsed:
+        if True not in [len(row) > 0 for col, row in csv.data.items()]:
+            print("{} doesn't contain data. Skipping.".format(csv.fname))
+        else:
+            csv_list.append(csv)
+    return csv_list
+
+
+def get_csv_paths(args):
+    """
+    Returns the paths of all .csv files (and binary columnar files, see readers.FORMATS) given by "--dir" or "--file",
+    in sorted order.
+    """
+    extensions = (".csv",) + tuple(FORMATS)
+    fpaths = []
+    if args.dir:
+        for directory in parse_arg_dirfile_list(args.dir):
+            for fname in sorted(os.listdir(directory)):
+                if fname.endswith(extensions):
+                    fpaths.append(os.path.join(directory, fname))
+    else:
+        for fname in parse_arg_dirfile_list(args.file):
+            if fname.endswith(extensions):
+                fpaths.append(fname)
+    return fpaths
+
+
 def parse_arg_dirfile_list(dirfile_list):
     """
     Looks at either "--dir" or "--file" and determines what to use.
@@ -49,14 +79,29 @@ def parse_arg_dirfile_list(dirfile_list):
     return sorted(list(set(dirfiles)))
 
 
+def positive_int(value):
+    """
+    Type of the options that take a number of rows, points or processes.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(value))
+    return number
+
+
 def get_arguments(args):
     """
     Set up all options here.
     """
     parser = argparse.ArgumentParser()
     data = parser.add_mutually_exclusive_group(required=True)
-    data.add_argument("-d", "--dir", help="directory containing .csv files (accepts Unix-style wildcards)")
-    data.add_argument("-f", "--file", help="comma-separated list of .csv files (accepts Unix-style wildcards)")
+    data.add_argument("-d", "--dir", help="directory containing .csv files (or .npz and Arrow/Feather files) "
+                                         "(accepts Unix-style wildcards)")
+    data.add_argument("-f", "--file", help="comma-separated list of .csv files (or .npz and Arrow/Feather files) "
+                                           "(accepts Unix-style wildcards)")
     parser.add_argument("-c", "--cols", help="comma-separated list of columns to plot. Use semicolons to group "
                                              "columns. Operations will be performed per group. EXAMPLE: "
                                              "\"-c core-[0-9]+;*power -a -m\" will plot 4 lines per CSV: min/avg of "
@@ -67,6 +112,12 @@ def get_arguments(args):
     parser.add_argument("-a", "--avg", help="plot avg of comma-separated fields as one line", action="store_true")
     parser.add_argument("-m", "--min", help="plot min of comma-separated fields as one line", action="store_true")
     parser.add_argument("-M", "--max", help="plot max of comma-separated fields as one line", action="store_true")
+    parser.add_argument("--std", help="plot standard deviation of comma-separated fields as one line",
+                        action="store_true")
+    parser.add_argument("--count", help="plot count of (non-NaN) comma-separated fields as one line",
+                        action="store_true")
+    parser.add_argument("--pct", help="plot comma-separated percentiles of comma-separated fields as one line each, "
+                                      "e.g. \"--pct 50,99\"")
     parser.add_argument("-i", "--indiv", help="generate individual plot for each .csv", action="store_true")
     parser.add_argument("-o", "--offset", help="shift y-values vertically by integer value", default=0)
     parser.add_argument("-S", "--scale", help="multiplies all y-values by float value", default=1)
@@ -82,45 +133,169 @@ def get_arguments(args):
     parser.add_argument("-B", "--bar", help="plot using bars instead of lines", action="store_true")
     parser.add_argument("-u", "--unique_colors", help="use unique colors for each line, even within the same CSV",
                         action="store_true")
-    parser.add_argument("-I", "--image", help="export as PNG (requires internet access). You may also manually export "
-                                              "as PNG from the HTML plot, but legend will be cut off if there are too "
-                                              "many lines", action="store_true")
+    parser.add_argument("-I", "--image", help="export as PNG (or SVG, see --image_format), rendered locally with "
+                                              "kaleido. You may also manually export as PNG from the HTML plot, but "
+                                              "legend will be cut off if there are too many lines",
+                        action="store_true")
+    parser.add_argument("--image_format", help="image format used by -I (default is png)", choices=["png", "svg"],
+                        default="png")
+    parser.add_argument("-C", "--compact", help="write compact HTML: values are embedded as binary (base64) arrays "
+                                                "and all plots share one plotly.min.js in the output directory",
+                        action="store_true")
+    parser.add_argument("--tiles", help="write tiled HTML: long lines start as a coarse min/max overview, and finer "
+                                        "levels are loaded from small files next to the HTML as you zoom in (no "
+                                        "server needed). Ignores --max_points", action="store_true")
+    parser.add_argument("--compact_dtype", help="precision of y-values embedded by --compact and --tiles (default is "
+                                                "float32)",
+                        choices=["float32", "float64"], default="float32")
     parser.add_argument("--xmin", help="minimum x-axis value")
     parser.add_argument("--xmax", help="maximum x-axis value")
     parser.add_argument("--ymin", help="minimum y-axis value")
     parser.add_argument("--ymax", help="maximum y-axis value")
     parser.add_argument("--xaxis", help="use a column for x-axis values")
     parser.add_argument("--xnorm", help="normalize x-axis to 'percent completion' for all lines", action="store_true")
-    parser.add_argument("--col_eq_val", help="filter rows where 'COL1=VAL1&COL2=val2...', e.g. 'name=Bob&day=Sunday'")
-    return parser.parse_args(args)
+    parser.add_argument("-j", "--jobs", help="number of .csv files to parse (and, with -i, plots to generate) in "
+                                             "parallel (default is 1)", type=positive_int,
+                        default=1)
+    parser.add_argument("--chunk_rows", help="stream each .csv in chunks of this many rows, keeping only the final "
+                                             "(operated) columns to bound memory on very large files",
+                        type=positive_int)
+    parser.add_argument("--resample", help="aggregate rows into one point per x-axis interval (before col "
+                                           "operations), e.g. \"1s\", \"500ms\" or \"5m\" (units assume the x-axis "
+                                           "is in seconds; a plain number is in x-axis units). Requires --xaxis")
+    parser.add_argument("--rolling", help="replace each point with the aggregate of the last N points (after "
+                                          "--resample, before col operations)", type=int)
+    parser.add_argument("--agg", help="aggregate used by --resample and --rolling: mean (default), min, max, sum, "
+                                      "count, or a percentile such as p99", default="mean")
+    parser.add_argument("--max_points", help="downsample each line to at most this many points (keeps peaks)",
+                        type=positive_int)
+    parser.add_argument("--downsample", help="downsampling method used with --max_points: 'lttb' "
+                                             "(largest-triangle-three-buckets, default) or 'minmax' (min/max "
+                                             "envelope)", choices=["lttb", "minmax"], default="lttb")
+    parser.add_argument("--reader", help="how .csv files are read: 'mmap' (memory-mapped and split with NumPy, "
+                                         "default) or 'text' (line by line)", choices=["mmap", "text"], default="mmap")
+    parser.add_argument("--cache", help="cache parsed columns on disk, so re-plotting unchanged files skips parsing "
+                                        "(not used with --chunk_rows)",
+                        action="store_true")
+    parser.add_argument("--cache_dir", help="directory used by --cache (default is \".csvplot_cache\")",
+                        default=".csvplot_cache")
+    parser.add_argument("--cache_size", help="maximum size of --cache_dir in MB; least recently used entries are "
+                                             "removed first (default is 1024)", default=1024)
+    parser.add_argument("--profile", help="record the wall time, CPU time, rows/sec and peak memory allocated by "
+                                          "each stage, for each file (including stages run by --jobs worker "
+                                          "processes), and write them as JSON next to the plot",
+                        action="store_true")
+    parser.add_argument("--follow", help="keep running while the .csv files grow: parse only the appended rows and "
+                                         "regenerate the plot(s) every --follow_interval seconds (Ctrl+C to stop). "
+                                         "Files with only a header are plotted once rows arrive",
+                        action="store_true")
+    parser.add_argument("--follow_interval", help="seconds between --follow refreshes (default is 5)", type=float,
+                        default=5)
+    parser.add_argument("--col_eq_val", help="filter rows where 'COL1=VAL1&COL2=val2...', e.g. 'name=Bob&day=Sunday'. "
+                                             "Also supports COL!=VAL, COL<VAL, COL>VAL, COL<=VAL, COL>=VAL, "
+                                             "COL=LO..HI (inclusive range), 'COL in {VAL1,VAL2}', and '|' (or), e.g. "
+                                             "'day in {Saturday,Sunday}&hour=9..17|name!=Bob'")
+    parsed = parser.parse_args(args)
+    if parsed.max_points is not None and parsed.max_points < MIN_POINTS[parsed.downsample]:
+        parser.error("--max_points must be at least {} with --downsample {}"
+                     .format(MIN_POINTS[parsed.downsample], parsed.downsample))
+    return parsed
 
 
 def generate_individual_plots(args, csv_list):
-    args.dir = None
+    """
+    Generates one plot per CSV. Axis ranges are computed once so all plots share the same axes.
+    Each plot gets its own copy of the args, so plots can be rendered in parallel (with --jobs).
+    """
     xaxis = args.xaxis if args.xaxis else None
     xmin = Plotter.get_x_min(csv_list, xaxis)
     xmax = Plotter.get_x_max(csv_list, xaxis)
-    ymin = Plotter.get_y_min(csv_list, xaxis) + args.offset
-    ymax = Plotter.get_y_max(csv_list, xaxis) + args.offset
+    ymin = Plotter.get_y_min(csv_list, xaxis)
+    ymax = Plotter.get_y_max(csv_list, xaxis)
+    plots = []
     for csv in csv_list:
-        args.file = csv.fname
-        plot = Plotter(args, [csv], xmin, xmax, ymin, ymax)
-        plot.generate_plot()
+        plot_args = argparse.Namespace(**vars(args))
+        plot_args.dir, plot_args.file = None, csv.fname
+        plots.append(Plotter(plot_args, [csv], xmin, xmax, ymin, ymax))
+    # Images are exported in a single batch, so the renderer only starts once
+    worker = create_image_job if args.image else render_plot
+    if args.jobs and args.jobs > 1 and len(plots) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(plots))) as pool:
+            results = profiler.collect(pool.map(profiler.run_in_worker, itertools.repeat(profiler.get_trace_memory()),
+                                                itertools.repeat(worker), plots))
+    else:
+        results = [worker(plot) for plot in plots]
+    if args.image:
+        export_images(results, args.image_format)
+
+
+def render_plot(plot):
+    plot.generate_plot()
+
+
+def create_image_job(plot):
+    return plot.create_figure(), plot.get_file_path()
 
 
 def main():
     # STEP 1: Parse args
     args = get_arguments(sys.argv[1:])
+    if args.profile:
+        profiler.enable()
 
     # STEP 2: Get a list of CSV objects.
     csv_list = get_csv_list(args)
 
     # STEP 3: Create a Plotter and generate plot(s)
+    plot_path = generate_plots(args, csv_list)
+    if args.profile and plot_path:
+        profiler.current.write_report(get_profile_path(args, plot_path))
+
+    # STEP 4: With --follow, keep parsing appended rows and regenerating
+    if args.follow:
+        follow(args, csv_list)
+
+
+def generate_plots(args, csv_list):
+    """
+    Returns the path of the plot, or the output directory if individual plots are generated.
+    With --follow, files without rows are skipped, and None is returned (nothing is plotted) if no file has rows yet.
+    """
+    if args.follow:
+        csv_list = drop_empty_csvs(csv_list)
+        if not csv_list:
+            print("No rows to plot yet, waiting for rows to be appended...")
+            return None
     if args.indiv:
         generate_individual_plots(args, csv_list)
-    else:
-        plot = Plotter(args, csv_list)
-        plot.generate_plot()
+        return args.out_dir
+    plot = Plotter(args, csv_list)
+    plot.generate_plot()
+    return plot.get_file_path()
+
+
+def get_profile_path(args, plot_path):
+    """
+    Returns where the --profile report is written: next to the plot, e.g. plots/pet_hunger.profile.json.
+    """
+    if os.path.isdir(plot_path):
+        return os.path.join(plot_path, "{}_profile.json".format(args.prefix) if args.prefix else "profile.json")
+    return "{}.profile.json".format(os.path.splitext(plot_path)[0])
+
+
+def follow(args, csv_list):
+    """
+    Regenerates the plot(s) every --follow_interval seconds until interrupted. Each refresh only parses the rows
+    appended to each file since the last one, and nothing is regenerated if no file has new rows.
+    """
+    print("Following {} file(s), press Ctrl+C to stop.".format(len(csv_list)))
+    try:
+        while True:
+            time.sleep(args.follow_interval)
+            if sum([csv.update(args) for csv in csv_list]):
+                generate_plots(args, csv_list)
+    except KeyboardInterrupt:
+        print("\nStopped following.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# Bump this whenever the parsed output for the same input could change, to invalidate old entries.
+CACHE_VERSION = 2
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed CSV columns, so re-plotting the same files skips text parsing entirely.
+    Each entry is a 2-D float64 .npy file (one row per column, memory-mapped on load) plus a .json list of column names.
+    Entries are evicted least-recently-used first once the cache grows beyond max_bytes.
+    EXAMPLE USAGE: cache.load(cache.key(fname, header, columns, args.col_eq_val))
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(fname, header, columns, row_filter):
+        """
+        Returns a key unique to the file (path, size, modification time, header) and to what is parsed out of it.
+        """
+        stat = os.stat(fname)
+        ident = [CACHE_VERSION, os.path.abspath(fname), stat.st_size, stat.st_mtime_ns, header, columns, row_filter]
+        return hashlib.sha1(json.dumps(ident).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Returns the cached dictionary of column arrays for a key, or None if it isn't cached.
+        Arrays are copy-on-write memory maps of the cache file, so changing them never modifies the cache.
+        """
+        npy_path, json_path = self.get_paths(key)
+        try:
+            with open(json_path) as json_file:
+                columns = json.load(json_file)
+            block = np.load(npy_path, mmap_mode='c')
+        except (OSError, ValueError):
+            return None
+        # Mark as recently used (unless a parallel run already evicted it, which doesn't affect the memory map)
+        try:
+            os.utime(npy_path)
+        except FileNotFoundError:
+            pass
+        return {column: block[num] for num, column in enumerate(columns)}
+
+    def store(self, key, data):
+        """
+        Stores a dictionary of (equal length) column arrays under a key, then evicts old entries if necessary.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        npy_path, json_path = self.get_paths(key)
+        columns = list(data)
+        block = np.vstack([data[column] for column in columns]) if columns else np.empty((0, 0))
+        # Write to temporary files of this process first, so an interrupted run never leaves a partial entry behind,
+        # and parallel runs (--jobs) storing the same entry never replace each other's files
+        with tempfile.NamedTemporaryFile('wb', dir=self.cache_dir, suffix='.tmp', delete=False) as npy_file:
+            np.save(npy_file, block)
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as json_file:
+            json.dump(columns, json_file)
+        os.replace(json_file.name, json_path)
+        os.replace(npy_file.name, npy_path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least-recently-used entries until the total size of the cache is at most max_bytes.
+        """
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, fname))
+                except FileNotFoundError:
+                    continue  # Evicted by a parallel run
+                entries.append((stat.st_mtime, stat.st_size, fname[:-len('.npy')]))
+        total = sum([size for mtime, size, key in entries])
+        for mtime, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in self.get_paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Already evicted by a parallel run
+            total -= size
+
+    def get_paths(self, key):
+        return os.path.join(self.cache_dir, key + '.npy'), os.path.join(self.cache_dir, key + '.json')
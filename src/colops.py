@@ -0,0 +1,61 @@
+import sys
+import numpy as np
+
+
+# Column operations that are always available, in the order their columns are created.
+BASIC_OPS = ("sum", "avg", "min", "max", "std", "count")
+
+
+def get_col_ops(args):
+    """
+    Looks at the col operation args (sum, avg, min, max, std, count, percentiles) to determine what ops to perform.
+    Percentiles are named "p<N>", e.g. "--pct 50,99" gives ["p50", "p99"].
+    """
+    ops = [op for op in BASIC_OPS if getattr(args, op, False)]
+    if getattr(args, "pct", None):
+        for pct in args.pct.split(','):
+            try:
+                value = float(pct)
+            except ValueError:
+                value = -1
+            if not 0 <= value <= 100:
+                print("You didn't use --pct correctly. Percentiles must be comma-separated numbers from 0 to 100.")
+                sys.exit(0)
+            ops.append("p{}".format(pct.strip()))
+    return ops
+
+
+def reduce_block(block, ops):
+    """
+    Reduces a 2-D block (one row per column, one column per CSV row) across its columns for every op at once.
+    Shared intermediates (e.g. the sum for avg and std) are only computed once.
+    Returns a dictionary of op => 1-D array with one value per CSV row.
+    """
+    results = dict()
+    numcols = block.shape[0]
+    if {"sum", "avg", "std"}.intersection(ops):
+        total = block.sum(axis=0)
+        mean = total / float(numcols)
+        if "sum" in ops:
+            results["sum"] = total
+        if "avg" in ops:
+            results["avg"] = mean
+        if "std" in ops:
+            results["std"] = np.sqrt(((block - mean) ** 2).sum(axis=0) / float(numcols))
+    if "min" in ops:
+        results["min"] = block.min(axis=0)
+    if "max" in ops:
+        results["max"] = block.max(axis=0)
+    if "count" in ops:
+        results["count"] = np.count_nonzero(~np.isnan(block), axis=0).astype(np.float64)
+    # All percentiles share a single partition of the block
+    pcts = [op for op in ops if op.startswith("p")]
+    if pcts and block.shape[1]:
+        values = np.percentile(block, [float(op[1:]) for op in pcts], axis=0)
+        for op, vals in zip(pcts, values):
+            results[op] = vals
+    elif pcts:
+        for op in pcts:
+            results[op] = np.empty(0)
+    # Return results in the order that ops were requested
+    return {op: results[op] for op in ops}
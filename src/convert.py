@@ -0,0 +1,140 @@
+import re
+import numpy as np
+
+NUMBER = re.compile(r'[-+]?[0-9]*\.?[0-9]+')
+SI_UNITS = {'k': 1000, 'm': 1000000}
+# Lookup tables by (ASCII) character code: padding and whitespace, characters that can be part of a plain number,
+# and the scale of a value's last character (of the SI units, or 0 for other characters)
+BLANK = np.zeros(128, dtype=bool)
+BLANK[[0] + [ord(char) for char in ' \t\r\n']] = True
+NUMBER_PART = BLANK.copy()
+NUMBER_PART[[ord(char) for char in '0123456789+-.eE']] = True
+SCALES = np.zeros(128)
+for unit, scale in SI_UNITS.items():
+    SCALES[ord(unit)] = SCALES[ord(unit.upper())] = scale
+
+
+class ConversionSummary:
+    """
+    Counts how many values of a column could not be converted as plain numbers, over one or more chunks.
+    "units" values had a number plus a unit/suffix (e.g. "2.4K"), "junk" values had no number at all (stored as NaN).
+    """
+    def __init__(self):
+        self.units, self.junk = 0, 0
+        self.unit_example, self.junk_example = None, None
+
+    def add(self, other):
+        self.units += other.units
+        self.junk += other.junk
+        self.unit_example = self.unit_example or other.unit_example
+        self.junk_example = self.junk_example or other.junk_example
+
+    def print_notes(self, column):
+        if self.units:
+            print("[NOTE] Interpreted {} value(s) with units in column '{}', e.g. '{}' as '{}'"
+                  .format(self.units, column, *self.unit_example))
+        if self.junk:
+            print("[NOTE] Could not interpret {} value(s) in column '{}' (e.g. '{}'), using NaN"
+                  .format(self.junk, column, self.junk_example))
+
+
+def convert_column(values):
+    """
+    Converts a column (list or array of strings or byte strings) to a float64 array in bulk.
+    Returns the array and a ConversionSummary.
+    Plain numeric columns are converted in a single call. Otherwise, cells are classified on their characters all at
+    once: plain numbers are converted together, as are numbers ending with an SI unit (K or M), which are then scaled.
+    Only the remaining cells are parsed one DISTINCT string at a time (see convert_distinct), so strings without any
+    number become NaN.
+    """
+    summary = ConversionSummary()
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        # Already numeric (read from a binary format): float64 columns are used as they are, without a copy
+        return values.astype(np.float64, copy=False), summary
+    try:
+        return np.array(values, dtype=np.float64), summary
+    except ValueError:
+        pass
+    values = np.asarray(values)
+    if values.dtype.kind not in 'SU':
+        values = values.astype(str)
+    if values.dtype.kind == 'U':
+        try:
+            values = values.astype(np.bytes_)  # ASCII text: a quarter of the memory, and faster to convert
+        except UnicodeEncodeError:
+            pass
+    values = np.ascontiguousarray(values)
+    # One row of character codes per cell, padded with NUL
+    width = max(values.dtype.itemsize // (4 if values.dtype.kind == 'U' else 1), 1)
+    chars = values.view(np.uint32 if values.dtype.kind == 'U' else np.uint8).reshape(len(values), width)
+    codes = np.minimum(chars, 127)  # Other characters are never blank, part of a number or a unit, like code 127
+    text = ~BLANK[codes]
+    has_text = text.any(axis=1)
+    last = width - 1 - np.argmax(text[:, ::-1], axis=1)
+    scales = SCALES[codes[np.arange(len(values)), last]] * has_text
+    converted = np.full(len(values), np.nan)
+    kinds = np.full(len(values), 3, dtype=np.int8)  # 0: numeric, 1: units, 2: junk, 3: not converted yet
+    plain = has_text & (scales == 0) & NUMBER_PART[codes].all(axis=1)
+    with_unit = scales > 0
+    # The SI unit is replaced by NUL, so the number before it is converted like a plain number
+    prefixes = chars[with_unit]
+    prefixes[np.arange(width) >= last[with_unit][:, None]] = 0
+    for mask, cells, factors, kind in ((plain, values[plain], 1, 0),
+                                       (with_unit, prefixes.view(values.dtype).ravel(), scales[with_unit], 1)):
+        try:
+            converted[mask] = cells.astype(np.float64) * factors
+            kinds[mask] = kind
+        except ValueError:
+            pass  # e.g. "1.2.3" or "abcK": parsed one by one below
+    if np.any(with_unit & (kinds == 1)):
+        first = np.flatnonzero(with_unit & (kinds == 1))[0]
+        summary.unit_example = (to_text(values[first:first + 1])[0], converted[first])
+    rest = kinds == 3
+    if rest.any():
+        converted[rest], kinds[rest] = convert_distinct(to_text(values[rest]), summary)
+    counts = np.bincount(kinds, minlength=3)
+    summary.units, summary.junk = int(counts[1]), int(counts[2])
+    return converted, summary
+
+
+def to_text(values):
+    if values.dtype.kind == 'S':
+        values = np.char.decode(values, 'utf-8', 'replace')
+    return np.char.strip(values.astype(str))
+
+
+def convert_distinct(values, summary):
+    """
+    Converts strings that aren't plain numbers (or numbers with an SI unit), classifying each DISTINCT string once.
+    Returns the converted values and their kinds (0: numeric, 1: units, 2: junk), and records examples in summary.
+    """
+    distinct, inverse = np.unique(values, return_inverse=True)
+    converted = np.empty(len(distinct), dtype=np.float64)
+    kinds = np.zeros(len(distinct), dtype=np.int8)
+    for num, value in enumerate(distinct):
+        try:
+            converted[num] = float(value)
+            continue
+        except ValueError:
+            pass
+        match = NUMBER.search(value)
+        if match:
+            converted[num] = convert_si(match.group(0), value.replace(match.group(0), ''))
+            kinds[num] = 1
+            summary.unit_example = summary.unit_example or (value, converted[num])
+        else:
+            converted[num] = np.nan
+            kinds[num] = 2
+            summary.junk_example = summary.junk_example or value
+    return converted[inverse], kinds[inverse]
+
+
+def convert_si(value, unit):
+    """
+    Tries to convert to SI units if applicable
+    """
+    unit = unit.strip().lower()
+    value = float(value)
+    if unit in SI_UNITS:
+        value = value * SI_UNITS[unit]
+    return value
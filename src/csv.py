@@ -1,22 +1,61 @@
 import os
-import re
 import sys
-import fnmatch
+import numpy as np
+from . import profiler
+from .cache import ParseCache
+from .colops import get_col_ops, reduce_block
+from .convert import ConversionSummary, convert_column
+from .headers import HeaderIndex
+from .predicate import RowFilter
+from .readers import open_reader
+from .resample import Resampler, check_agg, parse_interval
+from .stats import ColumnStats
 
 
 class CSV:
     """
-    Represents a SINGLE csv file as a dictionary of values for each column.
+    Represents a SINGLE csv file (or binary columnar file, see readers.FORMATS) as a dictionary of values for each
+    column.
+    Each column is a contiguous float64 NumPy array, which supports len(), indexing and iteration like a list.
+    Min/max/count of every column are kept in test_csv.stats, so axis ranges don't need to rescan the values.
     EXAMPLE USAGE: test_csv.data["core-0"]
     """
-    def __init__(self, fname, args):
-        print("Parsing {}...".format(fname))
+    # Number of rows parsed (and converted) at a time, if --chunk_rows is not used
+    DEFAULT_CHUNK_ROWS = 65536
+
+    def __init__(self, fname, args, data=None):
+        """
+        If data (a dictionary of already parsed columns, e.g. shared between plots) is given, the file isn't read.
+        """
+        print("Parsing {}...".format(fname) if data is None else "Using parsed columns of {}...".format(fname))
         self.fname = fname
-        self.data = self.parse_csv(fname, args)
-        # Get the number of rows for first arbitrary value
-        self.numrows = len(next(iter(self.data.values())))
-        self.handle_col_ops(args)
-        self.apply_modifiers(args)
+        self.resampler = self.get_resampler(args)
+        if (args.chunk_rows or args.follow) and data is None:
+            # Col operations and modifiers are applied while streaming, so they are part of this stage
+            with profiler.stage('parse', fname) as record:
+                self.data, self.stats = self.stream_csv(fname, args)
+                record['rows'] = self.count_rows(self.data)
+        else:
+            if data is None:
+                with profiler.stage('parse', fname) as record:
+                    data = self.parse_csv(fname, args)
+                    record['rows'] = self.count_rows(data)
+            if self.resampler:
+                with profiler.stage('resample', fname) as record:
+                    record['rows'] = self.count_rows(data)
+                    data = self.resampler.process(data, final=True)
+            with profiler.stage('col_ops', fname) as record:
+                self.data = self.handle_col_ops(data, args)
+                record['rows'] = self.count_rows(self.data)
+            with profiler.stage('modifiers', fname) as record:
+                # Summarize each column once here. Modifiers then update the summaries instead of rescanning.
+                self.stats = self.get_stats(self.data)
+                self.data = self.apply_modifiers(self.data, args)
+                record['rows'] = self.count_rows(self.data)
+        self.stats = self.modify_stats(self.stats, args)
+        self.numrows = self.count_rows(self.data)
+        # Growable copies of the columns that rows are appended to in --follow mode (see append_rows)
+        self.buffers = dict()
         print("Done.\n")
 
     def parse_csv(self, fname, args):
@@ -24,172 +63,297 @@ class CSV:
         Parses relevant and unique columns into data structure. Does NOT account for column operations.
         EXAMPLE: In "-c core.* --sum," this would store all cols beginning with "core," NOT a single col of their sum.
         """
-        def valid_row(split_row):
-            return split_row[0] and not split_row[0].startswith('#')
+        if not args.cache:
+            return self.concat_chunks(self.iter_csv(fname, args))
+        # Look up the parsed columns in the cache before parsing any text
+        self.check_file(fname)
+        with open_reader(fname, args.reader) as reader:
+            header = reader.header
+        if header is None:
+            return self.concat_chunks(self.iter_csv(fname, args))  # Nothing to cache (see iter_csv)
+        cache = ParseCache(args.cache_dir, int(float(args.cache_size) * 1024 * 1024))
+        key = cache.key(fname, header, self.get_fields_to_use(args, header), args.col_eq_val)
+        data = cache.load(key)
+        if data is not None:
+            print("[CACHE] Loaded parsed columns from cache.")
+            return data
+        data = self.concat_chunks(self.iter_csv(fname, args))
+        cache.store(key, data)
+        return data
+
+    def stream_csv(self, fname, args, resume=None):
+        """
+        Parses the CSV in chunks of --chunk_rows rows. Col operations and modifiers are applied to each chunk as soon as
+        it is read, and only the resulting columns are kept, so peak memory is bounded by the chunk size (plus output).
+        EXAMPLE: In "-c core.* --sum," only the single "sum" col is kept, never the full "core" cols.
+        Returns the columns, and their stats (before modifiers) merged over all chunks.
+        """
+        def process_chunk(chunk):
+            chunk = self.handle_col_ops(chunk, args)
+            for field, chunk_stats in self.get_stats(chunk).items():
+                stats[field] = stats[field].merge(chunk_stats) if field in stats else chunk_stats
+            return self.apply_modifiers(chunk, args)
+        stats = dict()
+        chunks = self.iter_csv(fname, args, args.chunk_rows, resume)
+        if self.resampler:
+            # With --follow, the last interval is kept until rows of the next interval are appended
+            chunks = self.resampler.iter_chunks(chunks, final=not args.follow)
+        data = self.concat_chunks(process_chunk(chunk) for chunk in chunks)
+        return data, stats
+
+    def update(self, args):
+        """
+        Used by --follow: parses only the rows appended to the file since it was last parsed, and appends them (after
+        col operations and modifiers) to the columns. Stats are merged with those of the new rows, so nothing that was
+        already parsed is read again. If the file shrank or its header changed, it is parsed again from the start.
+        If the file has no header (yet, or any more, e.g. it was truncated to 0 bytes), it has no rows until one is
+        written, and its columns are emptied.
+        Returns the number of new rows.
+        """
+        self.check_file(self.fname)
+        with open_reader(self.fname, 'mmap') as reader:
+            header = reader.header
+        if header is None:
+            if self.follow_header is not None:
+                print("{} was truncated, waiting for a header...".format(self.fname))
+            self.follow_header = self.follow_pos = None
+            self.data, self.stats, self.buffers, self.numrows = dict(), dict(), dict(), 0
+            return 0
+        if self.follow_header is None or header != self.follow_header or \
+                os.path.getsize(self.fname) < self.follow_pos[0]:
+            if self.follow_header is not None:
+                print("{} was truncated or replaced, parsing it again...".format(self.fname))
+            self.resampler = self.get_resampler(args)
+            self.data, stats = self.stream_csv(self.fname, args)
+            self.stats, self.buffers = self.modify_stats(stats, args), dict()
+            self.numrows = self.count_rows(self.data)
+            return self.numrows
+        new_data, new_stats = self.stream_csv(self.fname, args, resume=self.follow_pos)
+        for field, field_stats in self.modify_stats(new_stats, args).items():
+            self.stats[field] = self.stats[field].merge(field_stats) if field in self.stats else field_stats
+        return self.append_rows(new_data)
+
+    def append_rows(self, new_data):
+        """
+        Appends new rows (a dictionary of column arrays) to the columns. Each column is a view of a buffer that doubles
+        in size when it is full, so appending takes time proportional to the new rows, not to the rows already parsed.
+        Returns the number of new rows.
+        """
+        num_new = len(next(iter(new_data.values()), []))
+        total = self.numrows + num_new
+        for field, values in new_data.items():
+            buf = self.buffers.get(field)
+            if buf is None or len(buf) < total:
+                buf = np.empty(max(2 * self.numrows, total, 1), dtype=np.float64)
+                buf[:self.numrows] = self.data[field]
+                self.buffers[field] = buf
+            buf[self.numrows:total] = values
+            self.data[field] = buf[:total]
+        self.numrows = total
+        return num_new
+
+    def iter_csv(self, fname, args, chunk_rows=None, resume=None):
+        """
+        Generator version of parse_csv. Yields a dictionary of column arrays for every chunk_rows parsed rows
+        (DEFAULT_CHUNK_ROWS if not set). At least one (possibly empty) chunk is yielded if the file has a header.
+        The reader (--reader, memory-mapped by default, or the one registered for the file's extension in FORMATS, e.g.
+        for .npz or Arrow files) extracts only the needed fields of each chunk of rows. Then the
+        --col_eq_val filter is evaluated on the whole chunk, and the remaining values are converted column-by-column.
+        With --follow, the memory-mapped reader is always used, a last line that is still being written is left for
+        the next update, and the header and where to resume (see update) are saved. Parsing starts at resume if given.
+        A file without a header (e.g. empty, or only comments) has no columns, so it is skipped like other files without
+        data (see drop_empty_csvs in runme.py), or with --follow, kept until its header is written.
+        """
+        def convert_chunk(columns):
+            # Reject rows that don't meet the --col_eq_val condition before any per-cell work is done on them
+            mask = row_filter.mask(columns) if row_filter else None
+            chunk = dict()
+            for field, idx in field_indices.items():
+                values = columns[idx] if mask is None else np.asarray(columns[idx])[mask]
+                chunk[field], summary = convert_column(values)
+                summaries[field].add(summary)
+            return chunk
+        self.check_file(fname)
+        with open_reader(fname, 'mmap' if args.follow else args.reader) as reader:
+            header = reader.header
+            if header is None:
+                # Empty, or only comments: there are no rows (with --follow, until a header is written, see update)
+                print("{} does not contain a header{}.".format(fname, " yet" if args.follow else ""))
+                self.follow_header = self.follow_pos = None
+                return
+            # Binary columnar files are read as whole columns unless --chunk_rows is used, so nothing is copied
+            chunk_rows = chunk_rows or (None if reader.COLUMNAR else self.DEFAULT_CHUNK_ROWS)
+            if resume is None and reader.header_line:
+                print("[HEADER] Header found! (line {})".format(reader.header_line))
+            row_filter = RowFilter(args.col_eq_val, header) if args.col_eq_val else None
+            # Resolve the indices of the fields to use (and filter on) once, so the reader only extracts those fields
+            field_indices = {field: header.index(field) for field in self.get_fields_to_use(args, header)}
+            needed = sorted(set(field_indices.values()).union(row_filter.indices if row_filter else []))
+            summaries = {field: ConversionSummary() for field in field_indices}
+            if args.follow:
+                for columns in reader.iter_chunks(needed, chunk_rows, start=resume, complete_only=True):
+                    yield convert_chunk(columns)
+                self.follow_header, self.follow_pos = header, reader.end
+            else:
+                for columns in reader.iter_chunks(needed, chunk_rows):
+                    yield convert_chunk(columns)
+        # Values that weren't plain numbers are summarized once per column, rather than once per value
+        for field, summary in summaries.items():
+            summary.print_notes(field)
+
+    @classmethod
+    def read_columns(cls, fname, reader_name, fields, text_fields):
+        """
+        Reads the given fields of a file in one pass, without filtering rows.
+        Returns the header, a dictionary of field => float64 array, and a dictionary of text_fields => string array
+        (raw values, e.g. for evaluating --col_eq_val filters later).
+        """
+        cls.check_file(fname)
+        with open_reader(fname, reader_name) as reader:
+            header = reader.header
+            indices = {field: header.index(field) for field in set(fields).union(text_fields)}
+            summaries = {field: ConversionSummary() for field in fields}
+            numeric_chunks, text_chunks = [], []
+            chunk_rows = None if reader.COLUMNAR else cls.DEFAULT_CHUNK_ROWS
+            for columns in reader.iter_chunks(sorted(set(indices.values())), chunk_rows):
+                numeric_chunk = dict()
+                for field in fields:
+                    numeric_chunk[field], summary = convert_column(columns[indices[field]])
+                    summaries[field].add(summary)
+                numeric_chunks.append(numeric_chunk)
+                text_chunks.append({field: np.asarray(columns[indices[field]]) for field in text_fields})
+        for field, summary in summaries.items():
+            summary.print_notes(field)
+        return header, cls.concat_chunks(numeric_chunks), cls.concat_chunks(text_chunks)
+
+    @staticmethod
+    def count_rows(data):
+        # Get the number of rows for first arbitrary value
+        return len(next(iter(data.values()), []))
+
+    @staticmethod
+    def check_file(fname):
         if not os.path.exists(fname) or not os.path.isfile(fname):
             print("{} does not exist or is not a file. Aborting.".format(fname))
             sys.exit(0)
-        data, limits = dict(), dict()
-        with open(fname) as file:
-            # Get header. Skip comments and whitespace.
-            line_num = 1
-            header = [x.strip() for x in file.readline().split(',')]
-            while not valid_row(header):
-                # print("[SKIP] Not a header (line {})".format(line_num))
-                header = [x.strip() for x in file.readline().split(',')]
-                line_num += 1
-            print("[HEADER] Header found! (line {})".format(line_num))
-            fields_to_use = self.parse_arg_cols_list(args.cols, header)
-            if args.xaxis:
-                fields_to_use.append(args.xaxis)
-            for field in fields_to_use:
-                data[field] = []
-            # Get indices of conditional limits. limits[idx] = val
-            if args.col_eq_val:
-                for limit in args.col_eq_val.split('&'):
-                    lim = limit.split("=")
-                    if len(list(filter(None, lim))) != 2:  # Get rid of empty strings
-                        print("You didn't use --col_eq_val correctly. Format must be COL=VAL.")
-                        sys.exit(0)
-                    col, val = limit.split("=")[0], limit.split("=")[1]
-                    idx = header.index(col) if col in header else None
-                    if idx is not None:
-                        limits[idx] = val
-                    else:
-                        print("The column specified in --col_eq_val was not in headers. Aborting.")
-                        sys.exit(0)
-            # Parse data into dictionary. Only parse columns that were specified.
-            for row in file:
-                line_num += 1
-                split = row.split(',')
-                # Skip rows that don't match with header, or are blank/comments
-                if (len(split) != len(header)) or (not valid_row(split)):
-                    print("[SKIP] Bad row (line {})".format(line_num))
-                    continue
-                # Skip rows that don't meet --col_eq_val condition
-                if args.col_eq_val:
-                    if False in [(split[idx].strip() == val) for idx, val in limits.items()]:
-                        # print("[SKIP] Condition not met (line {})".format(line_num))
-                        continue
-                row_data = [x.strip() for x in split]
-                for num, value in enumerate(row_data):
-                    if header[num] in fields_to_use:
-                        if self.is_float(value):
-                            data[header[num]].append(float(value))
-                        # If the value isn't a float, it probably has units...try to handle intelligently
-                        else:
-                            modified_value = re.search('[-+]?[0-9]*\.?[0-9]+', value).group(0)
-                            # Try applying units (K or M) and convert to float
-                            modified_value = self.convert_si(modified_value, value.replace(modified_value, ''))
-                            print("[NOTE] Interpreting '{}' as '{}' (line {})"
-                                  .format(value, modified_value, line_num))
-                            data[header[num]].append(modified_value)
-            return data
+
+    @classmethod
+    def get_fields_to_use(cls, args, header):
+        """
+        Returns the header fields that need to be parsed: the "--cols" matches, and the "--xaxis" column.
+        """
+        fields_to_use = cls.parse_arg_cols_list(args.cols, header, cls.get_index_dir(args))
+        if args.xaxis:
+            fields_to_use.append(args.xaxis)
+        return fields_to_use
 
     @staticmethod
-    def parse_arg_cols_list(cols, search_list):
+    def get_resampler(args):
+        """
+        Returns the Resampler used for "--resample" and "--rolling", or None if neither is used.
+        """
+        if not (args.resample or args.rolling):
+            return None
+        if args.resample and not args.xaxis:
+            print("--resample groups rows by their x-axis values, so it requires --xaxis. Aborting.")
+            sys.exit(0)
+        if args.rolling is not None and args.rolling < 1:
+            print("You didn't use --rolling correctly. The window must be at least 1 point.")
+            sys.exit(0)
+        interval = parse_interval(args.resample) if args.resample else None
+        return Resampler(args.xaxis, interval, check_agg(args.agg), args.rolling)
+
+    @staticmethod
+    def get_index_dir(args):
+        # Resolved "--cols" patterns are only kept on disk if --cache is used
+        return args.cache_dir if args.cache else None
+
+    @staticmethod
+    def concat_chunks(chunks):
+        """
+        Joins a sequence of chunks (dictionaries of column arrays) into a single dictionary of column arrays.
+        """
+        columns = dict()
+        for chunk in chunks:
+            for field, values in chunk.items():
+                columns.setdefault(field, []).append(values)
+        return {field: values[0] if len(values) == 1 else np.concatenate(values) for field, values in columns.items()}
+
+    @staticmethod
+    def parse_arg_cols_list(cols, search_list, cache_dir=None):
         """
         Looks at "--cols" argument to determine what cols to save.
-        Supports both Unix-style and regex matching.
-        """
-        fields = re.split('[;,]', cols)
-        fields_to_use = []
-        for field in fields:
-            regex = fnmatch.translate(field)
-            matching_fields = list(filter(re.compile(regex).match, search_list))
-            # If Unix-style matching doesn't work, try regex
-            if len(matching_fields) == 0:
-                matching_fields = list(filter(re.compile("^{}$".format(field)).match, search_list))
-            if len(matching_fields) == 0:
-                print("\"{}\" not found in CSV headers. Check the first line of the CSV -- aborting.".format(field))
-                sys.exit(0)
-            fields_to_use += matching_fields
-        # Make sure no duplicate entries, and in order for idempotency
-        return sorted(list(set(fields_to_use)))
-
-    def handle_col_ops(self, args):
-        """
-        Converts saved columns to "combined" columns based on col operations (sum, avg, min, max).
+        Supports both Unix-style and regex matching. Matches are remembered per distinct header (see HeaderIndex).
+        """
+        return HeaderIndex(cache_dir).resolve(cols, search_list)
+
+    @classmethod
+    def handle_col_ops(cls, data, args):
+        """
+        Converts saved columns to "combined" columns based on col operations (sum, avg, min, max, std, count, pct).
         EXAMPLE: In "-c core.* -s," this would take existing cols and combine them into a single col of their sums.
+        Returns the updated dictionary of columns.
         """
-        # Returns a dictionary key for operated columns
-        def name(operation, fields):
-            return "{}_{}".format(operation, "/".join(fields))
+        ops = get_col_ops(args)
         # If there are no operations, then data is already good to go. Semicolons don't matter.
-        if not args.sum and not args.avg and not args.min and not args.max:
-            return
-        stored_field_names = [name for name, vals in self.data.items()]
+        if not ops:
+            return data
+        stored_field_names = [name for name, vals in data.items()]
+        operated_names = set()
         # For each colgroup (separated by semicolon);
         colgroups = args.cols.split(';')
+        colgroup_names = set(colgroups)
         for colgroup in colgroups:
-            cols = []
             raw_cols = colgroup.split(',')
-            matching_fields = self.parse_arg_cols_list(colgroup, stored_field_names)
-            cols += [self.data[x] for x in matching_fields]
+            matching_fields = cls.parse_arg_cols_list(colgroup, stored_field_names, cls.get_index_dir(args))
             # No need to operate on single columns
-            if len(cols) == 1:
+            if len(matching_fields) == 1:
                 continue
-            # Now, perform operation on cols
-            for i in range(0, len(cols[0])):
-                row_vals = [x[i] for x in cols]
-                if args.sum:
-                    if name('sum', raw_cols) not in self.data:
-                        self.data[name('sum', raw_cols)] = []
-                    self.data[name('sum', raw_cols)].append(sum(row_vals))
-                if args.avg:
-                    if name('avg', raw_cols) not in self.data:
-                        self.data[name('avg', raw_cols)] = []
-                    self.data[name('avg', raw_cols)].append(sum(row_vals) / float(len(row_vals)))
-                if args.min:
-                    if name('min', raw_cols) not in self.data:
-                        self.data[name('min', raw_cols)] = []
-                    self.data[name('min', raw_cols)].append(min(row_vals))
-                if args.max:
-                    if name('max', raw_cols) not in self.data:
-                        self.data[name('max', raw_cols)] = []
-                    self.data[name('max', raw_cols)].append(max(row_vals))
+            # Stack the group into a 2-D block (one row per column) and perform every operation on it in one pass
+            block = np.vstack([data[x] for x in matching_fields])
+            for operation, values in reduce_block(block, ops).items():
+                op_name = "{}_{}".format(operation, "/".join(raw_cols))
+                data[op_name] = values
+                operated_names.add(op_name)
         # Update data - add operated columns, remove individual columns
         filtered_data = dict()
-        for key, value in self.data.items():
-            used_individually = (len([x for x in args.cols.split(';') if x == key]) != 0) or key == args.xaxis
-            if used_individually or key.startswith(("sum", "avg", "min", "max")):
+        for key, value in data.items():
+            used_individually = key in colgroup_names or key == args.xaxis
+            if used_individually or key in operated_names:
                 filtered_data[key] = value
-        self.data = filtered_data
+        return filtered_data
 
-    def apply_modifiers(self, args):
+    @classmethod
+    def apply_modifiers(cls, data, args):
         """
         Applies scaling and offset modifications to all values (after col operations)
+        Returns the updated dictionary of columns.
         """
-        for colname, values in self.data.items():
-            if colname != args.xaxis:
-                self.data[colname] = [self.modify(args, val) for val in values]
+        return {colname: values if colname == args.xaxis else cls.modify(args, values)
+                for colname, values in data.items()}
 
     @staticmethod
-    def modify(args, value):
+    def get_stats(data):
         """
-        Applies scaling and offset modifications to a single value
+        Returns a dictionary of ColumnStats (min, max, count) for a dictionary of columns.
         """
-        offset, scale = int(args.offset), float(args.scale)
-        value = value * scale if scale else value
-        value = value + offset if offset else value
-        return value
+        return {colname: ColumnStats.of(values) for colname, values in data.items()}
 
-    @staticmethod
-    def convert_si(value, unit):
+    @classmethod
+    def modify_stats(cls, stats, args):
         """
-        Tries to convert to SI units if applicable
+        Applies scaling and offset modifications to column stats, the same way apply_modifiers does to the values.
         """
-        si = {'k': 1000, 'm': 1000000}
-        unit = unit.lower()
-        value = float(value)
-        if unit in si:
-            value = value * si[unit]
-        return value
+        return {colname: col_stats if colname == args.xaxis else col_stats.transform(lambda x: cls.modify(args, x))
+                for colname, col_stats in stats.items()}
 
     @staticmethod
-    def is_float(value):
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    def modify(args, value):
+        """
+        Applies scaling and offset modifications to a single value, or to a whole column array at once
+        """
+        offset, scale = int(args.offset), float(args.scale)
+        # A scale of 1 would only copy the column (which, for binary formats, may be a view of the file)
+        value = value * scale if scale and scale != 1 else value
+        value = value + offset if offset else value
+        return value
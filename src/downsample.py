@@ -0,0 +1,70 @@
+import numpy as np
+
+# Smallest max_points each method can reduce a trace to (it always keeps the first and last points). Traces are returned
+# unchanged for smaller values.
+MIN_POINTS = dict(lttb=3, minmax=4)
+
+
+def lttb(x_vals, y_vals, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last points, and from each bucket in between keeps
+    the point forming the largest triangle with the previously kept point and the average of the next bucket.
+    Peaks are preserved much better than by plain decimation.
+    """
+    x_vals, y_vals = np.asarray(x_vals, dtype=np.float64), np.asarray(y_vals, dtype=np.float64)
+    length = len(y_vals)
+    if max_points >= length or max_points < MIN_POINTS['lttb']:
+        return x_vals, y_vals
+    # Split points between first and last into (max_points - 2) buckets, and get the average point of each bucket
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.intp)
+    counts = np.diff(edges)
+    x_sums, y_sums = np.concatenate(([0.0], np.cumsum(x_vals))), np.concatenate(([0.0], np.cumsum(y_vals)))
+    avg_x = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / counts
+    avg_y = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / counts
+    # The point after the last bucket is the last point itself
+    avg_x, avg_y = np.append(avg_x[1:], x_vals[-1]), np.append(avg_y[1:], y_vals[-1])
+    keep = np.empty(max_points, dtype=np.intp)
+    keep[0], keep[-1] = 0, length - 1
+    prev = 0
+    for bucket in range(max_points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        prev_x, prev_y = x_vals[prev], y_vals[prev]
+        areas = np.abs((prev_x - avg_x[bucket]) * (y_vals[lo:hi] - prev_y) -
+                       (prev_x - x_vals[lo:hi]) * (avg_y[bucket] - prev_y))
+        prev = lo + int(np.argmax(areas))
+        keep[bucket + 1] = prev
+    return x_vals[keep], y_vals[keep]
+
+
+def minmax(x_vals, y_vals, max_points):
+    """
+    Min/max envelope downsampling. Keeps the first and last points, and the minimum and maximum point of each bucket
+    in between (in their original order), so every peak and trough is visible at any zoom level of the output.
+    """
+    x_vals, y_vals = np.asarray(x_vals, dtype=np.float64), np.asarray(y_vals, dtype=np.float64)
+    length = len(y_vals)
+    if max_points >= length or max_points < MIN_POINTS['minmax']:
+        return x_vals, y_vals
+    buckets = (max_points - 2) // 2
+    edges = np.linspace(1, length - 1, buckets + 1).astype(np.intp)
+    # Lay the buckets out as rows of equal width (padding the short ones), then reduce every row at once
+    width = int(np.max(np.diff(edges)))
+    idx = edges[:-1, None] + np.arange(width)
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, length - 2)
+    vals = y_vals[idx]
+    rows = np.arange(buckets)
+    bucket_min = idx[rows, np.where(valid, vals, np.inf).argmin(axis=1)]
+    bucket_max = idx[rows, np.where(valid, vals, -np.inf).argmax(axis=1)]
+    keep = np.unique(np.concatenate(([0], bucket_min, bucket_max, [length - 1])))
+    return x_vals[keep], y_vals[keep]
+
+
+METHODS = dict(lttb=lttb, minmax=minmax)
+
+
+def downsample(x_vals, y_vals, max_points, method='lttb'):
+    """
+    Reduces a trace to at most max_points points using the given method ("lttb" or "minmax").
+    """
+    return METHODS[method](x_vals, y_vals, max_points)
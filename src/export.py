@@ -0,0 +1,100 @@
+import os
+import json
+import base64
+import numpy as np
+
+PLOTLYJS_NAME = "plotly.min.js"
+DTYPES = dict(float32=("f4", np.float32), float64=("f8", np.float64))
+
+# Decodes base64 typed arrays in the page itself, so this works with any plotly.js that accepts typed arrays.
+# The script (PLOT_SCRIPT, or e.g. the tile viewer of tiles.py) runs once the figure is decoded, and plots it.
+HTML_TEMPLATE = """<html>
+<head><meta charset="utf-8" /></head>
+<body style="margin: 0;">
+    <div id="plot" style="height: 100vh; width: 100%;"></div>
+    <script src="{plotlyjs}"></script>
+    <script>
+        function decode(value) {{
+            if (!value || typeof value !== "object" || !value.bdata) {{
+                return value;
+            }}
+            var raw = atob(value.bdata), bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) {{
+                bytes[i] = raw.charCodeAt(i);
+            }}
+            return value.dtype === "f4" ? new Float32Array(bytes.buffer) : new Float64Array(bytes.buffer);
+        }}
+        var figure = {figure};
+        figure.data.forEach(function (trace) {{
+            trace.x = decode(trace.x);
+            trace.y = decode(trace.y);
+        }});
+{script}
+    </script>
+</body>
+</html>
+"""
+PLOT_SCRIPT = """        Plotly.newPlot("plot", figure.data, figure.layout, {"responsive": true});"""
+
+
+def write_compact_html(fig, file_path, dtype="float32"):
+    """
+    Writes a figure as HTML with every trace's x/y values stored as base64 typed arrays instead of decimal text.
+    y-values use dtype (float32 or float64). x-values use float32 only if that is lossless, so timestamps keep their
+    precision. The page references a single plotly.min.js shared by all plots in the same directory.
+    """
+    fig_dict = fig if isinstance(fig, dict) else fig.to_plotly_json()
+    write_page(file_path, fig_dict["data"], fig_dict.get("layout", {}), dtype, PLOT_SCRIPT)
+
+
+def write_page(file_path, data, layout, dtype, script):
+    """
+    Writes an HTML page (HTML_TEMPLATE) with the traces' x/y values embedded as base64 typed arrays, which runs script
+    once they are decoded. Also writes the shared plotly.min.js it references, if needed.
+    """
+    import plotly.utils
+    write_plotlyjs(os.path.dirname(file_path))
+    encoded = []
+    for trace in data:
+        trace = dict(trace)
+        if trace.get("x") is not None:
+            trace["x"] = encode_array(trace["x"], "float32", lossless=True)
+        if trace.get("y") is not None:
+            trace["y"] = encode_array(trace["y"], dtype)
+        encoded.append(trace)
+    figure = json.dumps(dict(data=encoded, layout=layout), cls=plotly.utils.PlotlyJSONEncoder)
+    with open(file_path, "w", encoding="utf-8") as html_file:
+        html_file.write(HTML_TEMPLATE.format(plotlyjs=PLOTLYJS_NAME, figure=figure, script=script))
+
+
+def write_plotlyjs(out_dir):
+    """
+    Writes the plotly.min.js shared by every compact (or tiled) plot in out_dir, unless it already exists.
+    """
+    import plotly.offline
+    plotlyjs_path = os.path.join(out_dir, PLOTLYJS_NAME)
+    if not os.path.exists(plotlyjs_path):
+        with open(plotlyjs_path, "w", encoding="utf-8") as plotlyjs_file:
+            plotlyjs_file.write(plotly.offline.get_plotlyjs())
+
+
+def encode_array(values, dtype, lossless=False):
+    """
+    Returns values as a plotly.js typed array spec: {"dtype": "f4"/"f8", "bdata": base64 string}.
+    If lossless is set and the values can't be represented exactly in dtype, float64 is used instead.
+    """
+    values = decode_array(values)
+    code, np_type = DTYPES[dtype]
+    converted = values.astype(np_type)
+    if lossless and np_type is not np.float64 and not np.array_equal(converted, values, equal_nan=True):
+        code, converted = "f8", values
+    return dict(dtype=code, bdata=base64.b64encode(converted.astype("<" + code).tobytes()).decode("ascii"))
+
+
+def decode_array(values):
+    """
+    Returns values (a list, array, or typed array spec that plotly already encoded) as a float64 array.
+    """
+    if isinstance(values, dict) and "bdata" in values:
+        values = np.frombuffer(base64.b64decode(values["bdata"]), dtype=np.dtype(values["dtype"]).newbyteorder("<"))
+    return np.asarray(values, dtype=np.float64)
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import fnmatch
+import tempfile
+
+
+class HeaderIndex:
+    """
+    Resolves "--cols" patterns to the columns of a header. Each distinct header is fingerprinted, and the column indices
+    each pattern matched are remembered for that fingerprint: in memory for the whole run, and (if cache_dir is given)
+    in a small .json sidecar per header, for later runs. Files with identical headers, chunks of the same file and the
+    col operations that group stored columns then each match a pattern only once.
+    EXAMPLE USAGE: HeaderIndex(".csvplot_cache").resolve("core-*;power", header)
+    """
+    # Fingerprint => {pattern => indices of the matching columns}, shared by every HeaderIndex of this process
+    memory = dict()
+
+    def __init__(self, cache_dir=None):
+        self.index_dir = os.path.join(cache_dir, 'headers') if cache_dir else None
+
+    @staticmethod
+    def fingerprint(header):
+        return hashlib.sha1("\n".join(header).encode()).hexdigest()
+
+    def resolve(self, cols, header):
+        """
+        Returns the sorted, unique header fields matching any of the comma or semicolon separated patterns in cols.
+        """
+        fingerprint = self.fingerprint(header)
+        patterns = self.memory.get(fingerprint)
+        if patterns is None:
+            patterns = self.memory[fingerprint] = self.load(fingerprint)
+        missing = [pattern for pattern in re.split('[;,]', cols) if pattern not in patterns]
+        for pattern in missing:
+            patterns[pattern] = self.match(pattern, header)
+        if missing:
+            self.store(fingerprint, patterns)
+        return sorted(set([header[idx] for pattern in re.split('[;,]', cols) for idx in patterns[pattern]]))
+
+    @staticmethod
+    def match(pattern, header):
+        """
+        Returns the indices of the header fields matching a single pattern.
+        Supports both Unix-style and regex matching.
+        """
+        regex = re.compile(fnmatch.translate(pattern))
+        matching = [idx for idx, field in enumerate(header) if regex.match(field)]
+        # If Unix-style matching doesn't work, try regex
+        if len(matching) == 0:
+            regex = re.compile("^{}$".format(pattern))
+            matching = [idx for idx, field in enumerate(header) if regex.match(field)]
+        if len(matching) == 0:
+            print("\"{}\" not found in CSV headers. Check the first line of the CSV -- aborting.".format(pattern))
+            sys.exit(0)
+        return matching
+
+    def load(self, fingerprint):
+        if not self.index_dir:
+            return dict()
+        try:
+            with open(os.path.join(self.index_dir, fingerprint + '.json')) as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return dict()
+
+    def store(self, fingerprint, patterns):
+        """
+        Saves the resolved patterns of a header. This is only an optimization, so failing to write is ignored.
+        """
+        if not self.index_dir:
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            # Write to a temporary file of this process first, so parallel runs never read (or replace) a partial index
+            with tempfile.NamedTemporaryFile('w', dir=self.index_dir, suffix='.tmp', delete=False) as index_file:
+                json.dump(patterns, index_file)
+            os.replace(index_file.name, os.path.join(self.index_dir, fingerprint + '.json'))
+        except OSError:
+            pass
@@ -1,11 +1,12 @@
 import os
-import sys
 import math
-import json
 import random
-import plotly
-import plotly.exceptions
-import plotly.graph_objs as go
+import numpy as np
+from . import profiler
+from .downsample import downsample
+from .export import write_compact_html
+from .tiles import write_tiled_html
+from .render import export_images
 
 
 class Plotter:
@@ -15,6 +16,8 @@ class Plotter:
     def __init__(self, args, csv_list, xmin=None, xmax=None, ymin=None, ymax=None):
         self.csv_list = csv_list
         self.common_name = self.get_longest_common_name(self.csv_list)
+        # Style dictionaries, shared by every trace with the same style (see get_style)
+        self.styles = dict()
         # NOTE: Max rows are required to be passed if generating individual files.
         self.arg = self.process_args(self.csv_list, args, xmin, xmax, ymin, ymax)
         self.print_args()
@@ -27,6 +30,7 @@ class Plotter:
         arg = dict()
         arg['data'] = args.dir if args.dir else args.file
         arg['cols'], arg['sum'], arg['avg'], arg['min'], arg['max'] = args.cols, args.sum, args.avg, args.min, args.max
+        arg['std'], arg['count'], arg['pct'] = args.std, args.count, args.pct
         # Set output names. If --indiv is used, ignore --name.
         arg['out_dir'], arg['prefix'] = args.out_dir, "{}_".format(args.prefix) if args.prefix else None
         if arg['data'] is args.dir:
@@ -36,7 +40,7 @@ class Plotter:
                 default_name = "_VS_".join([os.path.splitext(os.path.basename(x.fname))[0] for x in csv_list])
             else:
                 default_name = os.path.splitext(os.path.basename(csv_list[0].fname))[0]
-        extension = ".png" if args.image else ".html"
+        extension = ".{}".format(args.image_format) if args.image else ".html"
         if args.name and not args.indiv:
             arg['name'] = "{}{}".format(args.name, extension)
         else:
@@ -50,20 +54,27 @@ class Plotter:
         arg['y_title'] = args.y_title if args.y_title else (arg['cols'] if ';' not in arg['cols'] else "Unknown Units")
         arg['x_title'] = args.x_title if args.x_title else (args.xaxis if args.xaxis else "Unknown Units")
         # Set broad plot / output information
-        arg['img'] = 'png' if args.image else False
+        arg['img'] = args.image_format if args.image else False
+        arg['compact'], arg['compact_dtype'] = args.compact, args.compact_dtype
+        arg['tiles'] = args.tiles
         arg['indiv'] = args.indiv
         arg['extend'] = not args.extend_disable
         arg['bar'], arg['autobar'] = args.bar, args.autobar
         arg['unique_colors'] = args.unique_colors
         # Set maxima for axes. Global values are required if individual mode is used, so axes are consistent.
         arg['xaxis'] = args.xaxis if args.xaxis else None
-        arg['xmin'] = int(args.xmin) if args.xmin else (xmin if xmin else self.get_x_min(csv_list, args.xaxis))
-        arg['xmax'] = int(args.xmax) if args.xmax else (xmax if xmax else self.get_x_max(csv_list, args.xaxis))
-        arg['ymin'] = int(args.ymin) if args.ymin \
-            else (ymin if ymin else self.get_y_min(csv_list, args.xaxis))
-        arg['ymax'] = int(args.ymax) if args.ymax \
-            else (ymax if ymax else self.get_y_max(csv_list, args.xaxis))
+        with profiler.stage('ranging'):
+            arg['xmin'] = int(args.xmin) if args.xmin \
+                else (xmin if xmin is not None else self.get_x_min(csv_list, args.xaxis))
+            arg['xmax'] = int(args.xmax) if args.xmax \
+                else (xmax if xmax is not None else self.get_x_max(csv_list, args.xaxis))
+            arg['ymin'] = int(args.ymin) if args.ymin \
+                else (ymin if ymin is not None else self.get_y_min(csv_list, args.xaxis))
+            arg['ymax'] = int(args.ymax) if args.ymax \
+                else (ymax if ymax is not None else self.get_y_max(csv_list, args.xaxis))
         arg['xnorm'] = args.xnorm
+        # Tiled plots keep every point (in tiles loaded when zooming), so lines aren't downsampled beforehand
+        arg['max_points'], arg['downsample'] = None if args.tiles else args.max_points, args.downsample
         if arg['xnorm']:
             arg['xmin'], arg['xmax'] = 0, 100
             arg['x_title'] = '% completed: {}'.format(arg['x_title'])
@@ -71,50 +82,50 @@ class Plotter:
 
     def generate_plot(self):
         """
-        Generate either HTML or PNG. PNG requires internet access.
+        Generate either HTML or an image (PNG/SVG). Images are rendered locally and don't require internet access.
         """
-        plot_data = self.create_plot_data(self.csv_list)
-        plot_layout = self.create_plot_layout(self.arg['title'], self.arg['x_title'], self.arg['y_title'])
-        plot_fig = go.Figure(data=plot_data, layout=plot_layout)
-        if not os.path.exists(self.arg['out_dir']):
-            os.makedirs(self.arg['out_dir'])
-        filename = "{}{}".format(self.arg['prefix'], self.arg['name']) if self.arg['prefix'] else self.arg['name']
-        file_path = os.path.join(self.arg['out_dir'], filename)
+        plot_fig = self.create_figure()
+        file_path = self.get_file_path()
         if self.arg['img']:
-            proj_dir = sys.path[0].split("/src")[0]
-            logged_in = self.login_to_plotly("{}/config/config.json".format(proj_dir))
-            if not logged_in:
-                return
-            print("Generating PNG plot...", end='')
-            plotly.plotly.image.save_as(plot_fig, filename=file_path, width=1000, height=750)
-            print("done.\n\nSee {}/{}.".format(self.arg['out_dir'], filename))
+            with profiler.stage('image_export', file_path):
+                export_images([(plot_fig, file_path)], self.arg['img'])
+        elif self.arg['tiles']:
+            print("Generating tiled HTML plot...", end='')
+            with profiler.stage('html_write', file_path):
+                write_tiled_html(plot_fig, file_path, self.arg['compact_dtype'])
+            print("done.\n\nSee {}.".format(file_path))
+        elif self.arg['compact']:
+            print("Generating compact HTML plot...", end='')
+            with profiler.stage('html_write', file_path):
+                write_compact_html(plot_fig, file_path, self.arg['compact_dtype'])
+            print("done.\n\nSee {}.".format(file_path))
         else:
+            import plotly.offline
             print("Generating HTML plot...", end='')
-            plotly.offline.plot(plot_fig, filename=file_path, auto_open=False)
-            print("done.\n\nSee {}/{}.".format(self.arg['out_dir'], filename))
+            with profiler.stage('html_write', file_path):
+                plotly.offline.plot(plot_fig, filename=file_path, auto_open=False, validate=False)
+            print("done.\n\nSee {}.".format(file_path))
 
-    @staticmethod
-    def login_to_plotly(config_file):
-        try:
-            with open(config_file) as json_data_file:
-                data = json.load(json_data_file)
-                username = data['plotly']['username']
-                password = data['plotly']['password']
-            print("Logging into Plotly account to export as image...", end='')
-            if username and password:
-                plotly.plotly.sign_in(username, password)
-                print("logged in.")
-                return True
-            else:
-                print("\nYou need to specify a Plotly username and password to export images.\nAborting.")
-                return False
-        except FileNotFoundError:
-            print("config.json does not exist - please rename config.json.dist to config.json and add your Plotly "
-                  "account credentials. Aborting.")
-            return False
-        except plotly.exceptions.PlotlyError:
-            print("login failed.\nTo export as image, internet connection and valid account are required.\nAborting.")
-            return False
+    def create_figure(self):
+        """
+        Returns the figure as a plain dictionary (data and layout). Traces are built as dictionaries in a single pass,
+        without creating (and validating) a plotly object per trace. plotly itself is only imported once the figure is
+        written, so parse-only runs, -h and errors start up quickly.
+        """
+        with profiler.stage('trace_build') as record:
+            plot_data = self.create_plot_data(self.csv_list)
+            plot_layout = self.create_plot_layout(self.arg['title'], self.arg['x_title'], self.arg['y_title'])
+            record['rows'] = sum([csv.numrows for csv in self.csv_list])
+            return dict(data=plot_data, layout=plot_layout)
+
+    def get_file_path(self):
+        """
+        Returns the path of the output file, creating the output directory if needed.
+        """
+        if not os.path.exists(self.arg['out_dir']):
+            os.makedirs(self.arg['out_dir'])
+        filename = "{}{}".format(self.arg['prefix'], self.arg['name']) if self.arg['prefix'] else self.arg['name']
+        return os.path.join(self.arg['out_dir'], filename)
 
     def create_plot_data(self, csv_list):
         """
@@ -127,6 +138,7 @@ class Plotter:
         trace_id = 0
         for csv_it, csv in enumerate(csv_list):
             base_color = None if self.arg['unique_colors'] else self.choose_color(csv_it)  # Use same base color for CSV
+            x_vals = self.get_x_values(csv)  # Shared by every trace of the CSV
             for trace_it, (field, values) in enumerate(csv.data.items()):
                 if field == self.arg['xaxis']:
                     continue
@@ -136,11 +148,13 @@ class Plotter:
                 else:
                     trace_color = self.color_str(base_color, mod=trace_it)
                 trace_type = 'bar' if ((self.arg['autobar'] and trace_id > 2) or self.arg['bar']) else 'line'
-                traces.append(self.create_trace(trace_type, csv_it, trace_it, csv, values, trace_name,
-                                                trace_description, trace_color))
+                trace_x, y_vals = self.get_trace_points(x_vals, values)
+                # If the trace has 15 points or less (after downsampling), also show an ASCII bar graph in console.
+                traces.append(self.create_trace(trace_type, csv_it, trace_it, csv, trace_x, y_vals, trace_name,
+                                                trace_description, trace_color, len(trace_x) <= 15))
                 trace_id += 1
                 if self.arg['extend']:  # If max number of rows in current CSV is less than max, extend horizontally
-                    traces.append(self.create_extension(trace_type, csv_it, trace_it, csv, values, trace_name,
+                    traces.append(self.create_extension(trace_type, csv_it, trace_it, csv, y_vals, trace_name,
                                                         trace_description, trace_color))
         print("done.")
         return traces
@@ -160,18 +174,34 @@ class Plotter:
             trace_name += (" ({})".format(field) if trace_name else " {}".format(field.title()))
         return trace_name, trace_description
 
-    def create_trace(self, trace_type, csv_it, trace_it, csv, values, trace_name, trace_description, trace_color):
+    def get_x_values(self, csv):
+        """
+        Return the x-values of a csv: the "--xaxis" column (or row numbers), normalized to 0-100 with "--xnorm".
+        The column itself is never modified, and the result is computed once and shared by all traces of the csv.
+        """
+        x_vals = csv.data[self.arg['xaxis']] if self.arg['xaxis'] else np.arange(0, csv.numrows)
+        if self.arg['xnorm'] and len(x_vals):
+            return x_vals * (100.0 / x_vals[-1])
+        return x_vals
+
+    def get_trace_points(self, x_vals, values):
+        """
+        Return the x and y values to plot for a field, after downsampling.
+        If --max_points is set, traces with more points are downsampled (LTTB or min/max envelope) to that many.
+        """
+        if self.arg['max_points'] and len(values) > self.arg['max_points']:
+            return downsample(x_vals, values, self.arg['max_points'], self.arg['downsample'])
+        return x_vals, values
+
+    def create_trace(self, trace_type, csv_it, trace_it, csv, x_vals, y_vals, trace_name, trace_description,
+                     trace_color, show_histogram=False):
         """
         Create a line or bar trace.
         csv_it and trace_it are integers used to determine legend grouping (to group with extension lines).
-        csv and "values" are the current csv and its data values for a field (e.g. "temperature").
-        """
-        x_vals = csv.data[self.arg['xaxis']] if self.arg['xaxis'] else list(range(0, csv.numrows))
-        if self.arg['xnorm']:
-            x_vals[:] = [float(x/x_vals[-1])*100 for x in x_vals]
-        y_vals = values
-        # If max number of x-values is 15 or less, also show an ASCII bar graph in console.
-        if len(x_vals) <= 15:
+        csv is the current csv, and x_vals/y_vals are the points to plot for a field (e.g. "temperature").
+        If show_histogram is set, an ASCII bar graph of the trace is also shown in console.
+        """
+        if show_histogram:
             print("\nTrace:", trace_name)
             # Reformat long floats to single decimal precision
             # TODO: fix histogram function to format x-ticks properly, still has spacing issues
@@ -188,8 +218,11 @@ class Plotter:
     def create_extension(self, trace_type, csv_it, trace_it, csv, values, trace_name, trace_description, trace_color):
         """
         Create an extension trace. This means different styling, and hidden from legend.
+        "values" are the plotted (possibly downsampled) y-values of the trace being extended.
         """
-        ext_x, ext_y = self.get_extension_values(trace_type, self.get_x_max([csv], self.arg['xaxis']), values)
+        # Normalized lines always end at 100%
+        cur_max_x = 100 if self.arg['xnorm'] else self.get_x_max([csv], self.arg['xaxis'])
+        ext_x, ext_y = self.get_extension_values(trace_type, cur_max_x, values)
         trace_info = dict(
             x=ext_x,
             y=ext_y,
@@ -200,35 +233,46 @@ class Plotter:
         )
         return self.return_trace(trace_type, trace_info, trace_color, line_style='dot', bar_opacity=0.5)
 
-    @staticmethod
-    def return_trace(trace_type, trace_info, trace_color, line_fill=None, line_style=None, bar_opacity=1.0):
+    def return_trace(self, trace_type, trace_info, trace_color, line_fill=None, line_style=None, bar_opacity=1.0):
         """
         Return and modify the trace info based on trace type.
         """
-        if trace_type is 'line':
-            trace_info['mode'] = 'lines'
-            trace_info['line'] = dict(color=trace_color, dash=line_style)
-            trace_info['fill'] = line_fill
-            return go.Scatter(trace_info)
-        elif trace_type is 'bar':
-            trace_info['marker'] = dict(color=trace_color)
-            trace_info['opacity'] = bar_opacity
-            return go.Bar(trace_info)
+        if trace_type == 'line':
+            trace_info['type'] = 'scatter'
+            if line_fill:
+                trace_info['fill'] = line_fill
+        elif trace_type == 'bar':
+            trace_info['type'] = 'bar'
         else:
             print("Invalid trace type specified, skipping.")
             return
+        trace_info.update(self.get_style(trace_type, trace_color, line_style, bar_opacity))
+        return trace_info
+
+    def get_style(self, trace_type, trace_color, line_style=None, bar_opacity=1.0):
+        """
+        Return the style attributes of a trace. The same dictionary is returned for every trace with the same style.
+        """
+        key = (trace_type, trace_color, line_style, bar_opacity)
+        if key not in self.styles:
+            if trace_type == 'line':
+                line = dict(color=trace_color, dash=line_style) if line_style else dict(color=trace_color)
+                self.styles[key] = dict(mode='lines', line=line)
+            else:
+                self.styles[key] = dict(marker=dict(color=trace_color), opacity=bar_opacity)
+        return self.styles[key]
 
     def get_extension_values(self, trace_type, cur_max_x, values):
         """
         Return a list of x and y values to use for extensions.
+        Lines are a single two-point segment. Bars need one (flat) bar per integer x-value.
         """
         extension_x, extension_y = [], []
         if cur_max_x == self.arg['xmax']:
             return extension_x, extension_y
         cur_max_y = values[-1]
-        # Range doesn't support floats, so account for first val if float
-        if not self.is_integer(cur_max_x) and trace_type is not 'bar':
-            extension_x.append(cur_max_x)
+        if trace_type == 'line':
+            return [cur_max_x, self.arg['xmax']], [cur_max_y] * 2
         start_point = int(math.ceil(cur_max_x))
         extension_x += list(range(start_point, int(math.floor(self.arg['xmax']))))
         # Range doesn't include last int value
@@ -240,10 +284,11 @@ class Plotter:
         return extension_x, extension_y
 
     def create_plot_layout(self, title, x_title, y_title):
-        return go.Layout(
-            title=title,
-            xaxis=dict(title=x_title, range=[self.arg['xmin'], self.arg['xmax']], showline=True, showspikes=True),
-            yaxis=dict(title=y_title,
+        return dict(
+            title=dict(text=title),
+            xaxis=dict(title=dict(text=x_title), range=[self.arg['xmin'], self.arg['xmax']], showline=True,
+                       showspikes=True),
+            yaxis=dict(title=dict(text=y_title),
                        range=[self.arg['ymin'], self.arg['ymax'] + (0.05 * (self.arg['ymax'] - self.arg['ymin']))],
                        showline=True, showspikes=True),
             legend=dict(font=dict(size=10), tracegroupgap=0),
@@ -307,34 +352,32 @@ class Plotter:
     @staticmethod
     def get_x_min(csv_list, xaxis):
         if xaxis:
-            return min([min(x.data[xaxis]) for x in csv_list])
+            return min([x.stats[xaxis].min for x in csv_list])
         else:
             return 0
 
     @staticmethod
     def get_x_max(csv_list, xaxis):
         if xaxis:
-            return max([max(x.data[xaxis]) for x in csv_list])
+            return max([x.stats[xaxis].max for x in csv_list])
         else:
             return max([x.numrows-1 for x in csv_list])  # Subtract 1 because x axis starts from 0.
 
     @staticmethod
     def get_y_min(csv_list, xaxis):
         """
-        csv_list (list) => single csv (CSV object) => csv.data (dictionary) => field values (list)
+        csv_list (list) => single csv (CSV object) => csv.stats (dictionary) => field stats (ColumnStats)
         """
-        return min([val for csv in csv_list
-                    for field, csv_vals in csv.data.items() if field != xaxis
-                    for val in csv_vals])
+        return min([col_stats.min for csv in csv_list
+                    for field, col_stats in csv.stats.items() if field != xaxis and col_stats.count])
 
     @staticmethod
     def get_y_max(csv_list, xaxis):
         """
-        csv_list (list) => single csv (CSV object) => csv.data (dictionary) => field values (list)
+        csv_list (list) => single csv (CSV object) => csv.stats (dictionary) => field stats (ColumnStats)
         """
-        return max([val for csv in csv_list
-                    for field, csv_vals in csv.data.items() if field != xaxis
-                    for val in csv_vals])
+        return max([col_stats.max for csv in csv_list
+                    for field, col_stats in csv.stats.items() if field != xaxis and col_stats.count])
 
     @staticmethod
     def get_longest_common_name(csv_list):
@@ -0,0 +1,97 @@
+import re
+import sys
+import numpy as np
+from .convert import convert_column
+
+# COL, then an operator, then a value. Longer operators are listed first so "!=" isn't read as "=".
+TERM = re.compile(r'^\s*(?P<col>.+?)\s*(?P<op>!=|<=|>=|=|<|>|\s+in\s+)\s*(?P<val>.*?)\s*$')
+RANGE = re.compile(r'^(?P<lo>[-+]?[0-9]*\.?[0-9]+)\.\.(?P<hi>[-+]?[0-9]*\.?[0-9]+)$')
+USAGE = "Format must be COL=VAL, COL!=VAL, COL<VAL, COL>VAL, COL<=VAL, COL>=VAL, COL=LO..HI or COL in {VAL1,VAL2}, " \
+        "joined by '&' (and) or '|' (or)."
+
+
+class RowFilter:
+    """
+    A "--col_eq_val" expression compiled against a header, evaluated on a whole chunk of rows at once.
+    '&' binds tighter than '|', so "a=1&b=2|c=3" keeps rows where (a=1 and b=2) or c=3.
+    "=", "!=" and "in" compare text (like the original COL=VAL filter), "<", ">", "<=", ">=" and ranges compare numbers.
+    EXAMPLE USAGE: RowFilter("name in {boney,buttons}&timestamp=2..8", header).mask(columns)
+    """
+    def __init__(self, expression, header):
+        # List of OR-ed groups, each a list of AND-ed (column index, operator, value) terms
+        self.groups = [[self.parse_term(term, header) for term in group.split('&')] for group in expression.split('|')]
+        # Indices of the columns needed to evaluate the filter
+        self.indices = sorted(set([idx for group in self.groups for idx, op, val in group]))
+
+    @staticmethod
+    def parse_term(term, header):
+        """
+        Compiles a single comparison into (column index, operator, value).
+        """
+        match = TERM.match(term)
+        if not match or not match.group('val'):
+            print("You didn't use --col_eq_val correctly. {}".format(USAGE))
+            sys.exit(0)
+        col, op, val = match.group('col'), match.group('op').strip(), match.group('val')
+        if col not in header:
+            print("The column specified in --col_eq_val was not in headers. Aborting.")
+            sys.exit(0)
+        if op == 'in':
+            if not (val.startswith('{') and val.endswith('}')):
+                print("You didn't use --col_eq_val correctly. {}".format(USAGE))
+                sys.exit(0)
+            val = [x.strip() for x in val[1:-1].split(',')]
+        elif op == '=' and RANGE.match(val):
+            op, val = '..', (float(RANGE.match(val).group('lo')), float(RANGE.match(val).group('hi')))
+        elif op in ('<', '>', '<=', '>='):
+            try:
+                val = float(val)
+            except ValueError:
+                print("You didn't use --col_eq_val correctly. '{}' must compare with a number.".format(term))
+                sys.exit(0)
+        return header.index(col), op, val
+
+    def mask(self, columns):
+        """
+        Given a dictionary of column index => array (or list) of raw (byte) strings (or numbers) for a chunk of rows,
+        returns a boolean array of the rows that pass the filter.
+        """
+        text, numbers = dict(), dict()
+        rows_mask = None
+        for group in self.groups:
+            group_mask = None
+            for idx, op, val in group:
+                if op in ('=', '!=', 'in') and np.asarray(columns[idx]).dtype.kind in 'biuf':
+                    # Columns of binary formats are already numbers, so they are compared with numbers, not text
+                    values, val = columns[idx], convert_column(np.atleast_1d(val))[0]
+                    val = val if op == 'in' else val[0]
+                elif op in ('=', '!=', 'in'):
+                    if idx not in text:
+                        values = np.asarray(columns[idx])
+                        if values.dtype.kind == 'S':
+                            values = np.char.decode(values, 'utf-8', 'replace')
+                        text[idx] = np.char.strip(values.astype(str))
+                    values = text[idx]
+                else:
+                    if idx not in numbers:
+                        numbers[idx] = convert_column(columns[idx])[0]
+                    values = numbers[idx]
+                if op == '=':
+                    term_mask = values == val
+                elif op == '!=':
+                    term_mask = values != val
+                elif op == 'in':
+                    term_mask = np.isin(values, val)
+                elif op == '..':
+                    term_mask = (values >= val[0]) & (values <= val[1])
+                elif op == '<':
+                    term_mask = values < val
+                elif op == '>':
+                    term_mask = values > val
+                elif op == '<=':
+                    term_mask = values <= val
+                else:
+                    term_mask = values >= val
+                group_mask = term_mask if group_mask is None else group_mask & term_mask
+            rows_mask = group_mask if rows_mask is None else rows_mask | group_mask
+        return rows_mask
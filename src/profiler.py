@@ -0,0 +1,182 @@
+import json
+import time
+import tracemalloc
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, rows/sec and (if trace_memory is set) peak memory allocated by each stage of a
+    run, for each file. Hooks (functions taking the record of a stage) are called whenever a stage finishes.
+    EXAMPLE USAGE:
+        with profiler.stage("parse", fname) as record:
+            data = parse(fname)
+            record["rows"] = len(data)
+    """
+    def __init__(self, trace_memory=True):
+        self.records, self.hooks = [], []
+        self.trace_memory = trace_memory
+        # Records of the stages currently running (stages can be nested)
+        self.open_records = []
+        self.start = time.perf_counter()
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stage(self, name, fname=None):
+        return Stage(self, name, fname)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def merge(self, records):
+        """
+        Adds the records of stages that ran in another process (see run_in_worker), calling the hooks for each.
+        """
+        for record in records:
+            self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def begin(self, record):
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.update_peaks(peak)
+            tracemalloc.reset_peak()
+            record['alloc_start'], record['alloc_peak'] = current, current
+        self.open_records.append(record)
+
+    def end(self, record):
+        self.open_records.remove(record)
+        if self.trace_memory:
+            self.update_peaks(tracemalloc.get_traced_memory()[1], [record])
+            record['peak_alloc_mb'] = round((record.pop('alloc_peak') - record.pop('alloc_start')) / 1024 / 1024, 3)
+        if record.get('rows') is not None:
+            record['rows_per_sec'] = round(record['rows'] / record['wall_s']) if record['wall_s'] else None
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def update_peaks(self, peak, records=()):
+        """
+        Tracks the allocation peak of every open stage, since reset_peak() is called whenever a nested stage starts.
+        """
+        for record in self.open_records + list(records):
+            record['alloc_peak'] = max(record['alloc_peak'], peak)
+
+    def get_report(self):
+        """
+        Returns every recorded stage, plus the totals of each stage over all files.
+        """
+        totals = dict()
+        for record in self.records:
+            total = totals.setdefault(record['stage'], dict(wall_s=0.0, cpu_s=0.0, count=0))
+            total['wall_s'] = round(total['wall_s'] + record['wall_s'], 6)
+            total['cpu_s'] = round(total['cpu_s'] + record['cpu_s'], 6)
+            total['count'] += 1
+            if 'peak_alloc_mb' in record:
+                total['peak_alloc_mb'] = max(total.get('peak_alloc_mb', 0), record['peak_alloc_mb'])
+        return dict(total_wall_s=round(time.perf_counter() - self.start, 6), totals=totals, stages=self.records)
+
+    def write_report(self, file_path):
+        with open(file_path, 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent=2)
+        print("See {} for the profile.".format(file_path))
+
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+
+
+class Stage:
+    """
+    Context manager returned by Profiler.stage(). Returns the record of the stage, so rows can be added to it.
+    """
+    def __init__(self, profiler, name, fname):
+        self.profiler = profiler
+        self.record = dict(stage=name, file=fname)
+
+    def __enter__(self):
+        self.profiler.begin(self.record)
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        self.record['wall_s'] = round(time.perf_counter() - self.wall, 6)
+        self.record['cpu_s'] = round(time.process_time() - self.cpu, 6)
+        self.profiler.end(self.record)
+
+
+class NullStage:
+    """
+    Used when profiling is disabled: entering and leaving it does nothing.
+    """
+    def __enter__(self):
+        return dict()
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_STAGE = NullStage()
+# The enabled Profiler, if any
+current = None
+
+
+def enable(trace_memory=True):
+    """
+    Starts recording stages, and returns the Profiler (e.g. to add hooks).
+    """
+    global current
+    current = Profiler(trace_memory)
+    return current
+
+
+def disable():
+    """
+    Stops recording stages, and returns the Profiler that was enabled (if any).
+    """
+    global current
+    profiler, current = current, None
+    if profiler:
+        profiler.close()
+    return profiler
+
+
+def stage(name, fname=None):
+    """
+    Returns a context manager that records a stage if profiling is enabled, and does nothing otherwise.
+    """
+    return current.stage(name, fname) if current else NULL_STAGE
+
+
+def run_in_worker(trace_memory, function, *args):
+    """
+    Calls function(*args) in a worker process (e.g. of --jobs). If trace_memory is not None (profiling is enabled in the
+    parent, see get_trace_memory), the stages it runs are recorded by a new Profiler of the worker.
+    Returns the result and the records of those stages, to be merged into the parent's Profiler with collect().
+    """
+    global current
+    current = Profiler(trace_memory) if trace_memory is not None else None
+    try:
+        return function(*args), current.records if current else []
+    finally:
+        disable()
+
+
+def get_trace_memory():
+    """
+    Returns what to pass to run_in_worker: whether the enabled Profiler traces memory, or None if profiling is disabled.
+    """
+    return current.trace_memory if current else None
+
+
+def collect(results):
+    """
+    Given the (result, records) pairs returned by run_in_worker, merges the records into the enabled Profiler (if any)
+    and returns the results.
+    """
+    results = list(results)
+    for result, records in results:
+        if current:
+            current.merge(records)
+    return [result for result, records in results]
@@ -0,0 +1,355 @@
+import os
+import sys
+import mmap
+import struct
+import zipfile
+from operator import itemgetter
+import numpy as np
+
+
+def valid_row(split_row):
+    return split_row[0] and not split_row[0].startswith('#')
+
+
+class TextReader:
+    """
+    Reads a CSV file line by line as text.
+    iter_chunks() yields a dictionary of column index => list of raw strings for every chunk of rows.
+    """
+    # Set for readers of binary columnar formats, whose columns are already typed arrays (see ColumnarReader)
+    COLUMNAR = False
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.file = open(fname)
+        self.header, self.header_line = self.read_header()
+
+    def read_header(self):
+        """
+        Reads lines until the header is found. Skips comments and whitespace.
+        Returns the header fields and the (1-based) line number of the header, or (None, None) if the file doesn't
+        contain a header (e.g. it is empty, or only has comments).
+        """
+        line_num = 1
+        line = self.file.readline()
+        header = [x.strip() for x in line.split(',')]
+        while not valid_row(header):
+            # print("[SKIP] Not a header (line {})".format(line_num))
+            if not line:
+                return None, None
+            line = self.file.readline()
+            header = [x.strip() for x in line.split(',')]
+            line_num += 1
+        return header, line_num
+
+    def iter_chunks(self, indices, chunk_rows):
+        """
+        Yields the fields at the given (sorted) header indices for every chunk_rows valid rows.
+        Rows are only split as far as the last needed field. At least one (possibly empty) chunk is yielded.
+        """
+        get_needed = itemgetter(*indices) if len(indices) > 1 else (lambda split_row: (split_row[indices[0]],))
+        num_commas, max_split = len(self.header) - 1, indices[-1] + 1
+        line_num, rows, chunks_yielded = self.header_line, [], 0
+        for row in self.file:
+            line_num += 1
+            # Without its line ending, so an empty line of a single-column file is blank (as for MmapReader)
+            split = row.rstrip('\r\n').split(',', max_split)
+            # Skip rows that don't match with header, or are blank/comments
+            if (row.count(',') != num_commas) or (not valid_row(split)):
+                print("[SKIP] Bad row (line {})".format(line_num))
+                continue
+            rows.append(get_needed(split))
+            if len(rows) == chunk_rows:
+                yield self.to_columns(rows, indices)
+                rows, chunks_yielded = [], chunks_yielded + 1
+        if rows or not chunks_yielded:
+            yield self.to_columns(rows, indices)
+
+    @staticmethod
+    def to_columns(rows, indices):
+        return {idx: [row[num] for row in rows] for num, idx in enumerate(indices)}
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MmapReader(TextReader):
+    """
+    Memory-maps a CSV file and finds row and field boundaries in the raw bytes with NumPy.
+    Fields are gathered straight from the mapped buffer into fixed-width byte string arrays (which NumPy converts to
+    floats directly), so no str object is created per line or per cell.
+    iter_chunks() yields a dictionary of column index => byte string array for every chunk of rows.
+    """
+    # Bytes scanned for line boundaries at a time (grows if a single line is longer)
+    WINDOW_BYTES = 1 << 24
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.file = open(fname, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.buf = np.frombuffer(self.mm, dtype=np.uint8)
+        self.header, self.header_line = self.read_header()
+
+    def read_header(self):
+        """
+        Reads lines until the header is found. Skips comments and whitespace.
+        Returns the header fields and the (1-based) line number of the header, or (None, None) if the file doesn't
+        contain a header. Data starts at self.data_start.
+        """
+        pos, line_num = 0, 1
+        while pos < len(self.mm):
+            end = self.mm.find(b'\n', pos)
+            end = len(self.mm) if end == -1 else end
+            header = [x.strip() for x in self.mm[pos:end].decode(errors='replace').split(',')]
+            pos = end + 1
+            if valid_row(header):
+                self.data_start = pos
+                return header, line_num
+            line_num += 1
+        return None, None
+
+    def iter_chunks(self, indices, chunk_rows, start=None, complete_only=False):
+        """
+        Yields the fields at the given header indices for every (at most) chunk_rows lines.
+        At least one (possibly empty) chunk is yielded. Each window of the buffer is scanned for line boundaries once,
+        then split into chunks, so small chunks don't rescan the rest of the window.
+        Reading resumes at start (a (byte offset, line number) pair saved from self.end) if given. If complete_only is
+        set, a last line without a trailing newline (e.g. still being written) is left for later.
+        Once all chunks are read, self.end is the (byte offset, line number) to resume from.
+        """
+        pos, line_num = start or (self.data_start, self.header_line)
+        size = len(self.buf)
+        window, chunks_yielded, block, lines = self.WINDOW_BYTES, 0, None, None
+        while pos < size:
+            block = self.buf[pos:pos + window]
+            newlines = np.flatnonzero(block == ord('\n'))
+            at_end = pos + len(block) >= size
+            if len(newlines) == 0 and not at_end:
+                window *= 2
+                continue
+            if at_end and (len(newlines) == 0 or newlines[-1] != len(block) - 1) and not complete_only:
+                newlines = np.append(newlines, len(block))  # Last line has no trailing newline
+            if len(newlines) == 0:
+                break  # Only an incomplete last line is left
+            for first in range(0, len(newlines), chunk_rows):
+                ends = newlines[first:first + chunk_rows]
+                # Lines of the chunk, relative to the part of the block they span
+                offset = int(newlines[first - 1]) + 1 if first else 0
+                starts = np.concatenate(([0], ends[:-1] + 1 - offset))
+                lines = block[offset:int(ends[-1]) + 1]
+                yield self.parse_lines(lines, starts, ends - offset, indices, line_num)
+                chunks_yielded += 1
+                line_num += len(ends)
+            pos += int(newlines[-1]) + 1
+        self.end = (min(pos, size), line_num)
+        del block, lines
+        if not chunks_yielded:
+            yield {idx: np.empty(0, dtype='S1') for idx in indices}
+
+    def parse_lines(self, block, starts, ends, indices, line_num):
+        """
+        Given a block of the buffer and the start/end offsets of its lines, returns the needed fields of valid lines.
+        A line is valid if it has as many fields as the header, and its first field is not empty or a comment.
+        """
+        num_commas = len(self.header) - 1
+        # Drop the '\r' of Windows line endings
+        ends = ends - ((ends > starts) & (block[np.maximum(ends - 1, 0)] == ord('\r')))
+        commas = np.flatnonzero(block[:int(ends[-1])] == ord(','))
+        first = np.searchsorted(commas, starts)
+        count = np.searchsorted(commas, ends) - first
+        first_end = np.where(count > 0, commas[np.minimum(first, len(commas) - 1)], ends) if len(commas) else ends
+        valid = (count == num_commas) & (first_end > starts) & \
+                (block[np.minimum(starts, len(block) - 1)] != ord('#'))
+        for bad in np.flatnonzero(~valid):
+            print("[SKIP] Bad row (line {})".format(line_num + int(bad) + 1))
+        starts, ends, first = starts[valid], ends[valid], first[valid]
+        columns = dict()
+        for idx in indices:
+            field_starts = starts if idx == 0 else commas[first + idx - 1] + 1
+            field_ends = ends if idx == num_commas else commas[first + idx]
+            columns[idx] = self.gather(block, field_starts, field_ends)
+        return columns
+
+    @staticmethod
+    def gather(block, starts, ends):
+        """
+        Copies the bytes between each start/end offset into a fixed-width byte string array (one string per field).
+        """
+        widths = ends - starts
+        width = max(int(widths.max()) if len(widths) else 0, 1)
+        offsets = np.arange(width)
+        chars = block[np.minimum(starts[:, None] + offsets, len(block) - 1)]
+        chars[offsets >= widths[:, None]] = 0
+        return chars.view('S{}'.format(width)).ravel()
+
+    def close(self):
+        del self.buf
+        try:
+            if self.mm:
+                self.mm.close()
+        except BufferError:
+            pass  # Still referenced by a view; the mapping is released once that is garbage collected
+        self.file.close()
+
+
+class ColumnarReader:
+    """
+    Base class of the readers of binary columnar formats, which store every column as a typed array. There are no rows
+    to split or fields to convert, so only the needed columns are read, as NumPy arrays that are views of the (memory-
+    mapped) file where possible. Subclasses implement read_header() (returning the column names) and read_column(idx).
+    iter_chunks() yields a dictionary of column index => array for every chunk of rows, like the CSV readers.
+    """
+    COLUMNAR = True
+
+    def __init__(self, fname):
+        self.fname = fname
+        # There is no header line, the column names are part of the file's metadata
+        self.header, self.header_line = self.read_header(), None
+
+    def iter_chunks(self, indices, chunk_rows=None, start=None, complete_only=False):
+        """
+        Yields the columns at the given header indices for every chunk_rows rows, or as a single chunk if chunk_rows is
+        not set. Chunks are slices, so no values are copied. At least one (possibly empty) chunk is yielded.
+        Reading resumes at start (a (file size, row) pair saved from self.end) if given: binary files are rewritten as a
+        whole, so rows that were already read are skipped. If complete_only is set, the file is still being written, so
+        the columns are copied rather than mapped (a mapped file that is rewritten would change the parsed values).
+        """
+        columns = {idx: np.array(self.get_column(idx)) if complete_only else self.get_column(idx) for idx in indices}
+        num_rows = len(columns[indices[0]])
+        if any(len(values) != num_rows for values in columns.values()):
+            print("The columns of {} don't all have the same length. Aborting.".format(self.fname))
+            sys.exit(0)
+        first = min(start[1], num_rows) if start else 0
+        step = chunk_rows or max(num_rows - first, 1)
+        for pos in range(first, max(num_rows, first + 1), step):
+            yield {idx: values[pos:pos + step] for idx, values in columns.items()}
+        self.end = (os.path.getsize(self.fname), num_rows)
+
+    def get_column(self, idx):
+        """
+        Returns a column as a 1-D array. Dates and durations are converted to seconds, so they work as an x-axis.
+        """
+        values = np.asarray(self.read_column(idx))
+        if values.ndim != 1:
+            print("Column \"{}\" of {} is not a 1-D array. Aborting.".format(self.header[idx], self.fname))
+            sys.exit(0)
+        if values.dtype.kind in 'mM':
+            seconds = values.astype('m8[ns]' if values.dtype.kind == 'm' else 'M8[ns]').astype(np.int64) / 1e9
+            return np.where(np.isnat(values), np.nan, seconds)
+        return values
+
+    def read_header(self):
+        raise NotImplementedError
+
+    def read_column(self, idx):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NpzReader(ColumnarReader):
+    """
+    Reads a NumPy .npz archive holding one 1-D array per column, named by its key
+    (e.g. written by np.savez("run.npz", timestamp=timestamps, power=power)).
+    Arrays stored uncompressed (np.savez rather than np.savez_compressed) are memory-mapped instead of read.
+    """
+    def read_header(self):
+        self.npz = np.load(self.fname)
+        return list(self.npz.files)
+
+    def read_column(self, idx):
+        values = self.map_member(self.header[idx] + '.npy')
+        return self.npz[self.header[idx]] if values is None else values
+
+    def map_member(self, member):
+        """
+        Returns a copy-on-write memory map of an uncompressed .npy member, or None if it can't be mapped.
+        """
+        info = self.npz.zip.getinfo(member)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+        with open(self.fname, 'rb') as npz_file:
+            # The member's data follows its local header: 30 bytes (ending with the lengths of the name and extra
+            # field), the name, then the extra field
+            npz_file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', npz_file.read(30)[26:30])
+            npz_file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(npz_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npz_file)
+            elif version == (2, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npz_file)
+            else:
+                return None
+            offset = npz_file.tell()
+        if dtype.hasobject or len(shape) != 1 or not shape[0]:
+            return None
+        return np.memmap(self.fname, dtype=dtype, mode='c', offset=offset, shape=shape)
+
+    def close(self):
+        self.npz.close()
+
+
+class ArrowReader(ColumnarReader):
+    """
+    Reads an Arrow IPC file (also known as Feather v2) or stream with pyarrow. The file is memory-mapped, and numeric
+    columns without nulls are used without copying.
+    """
+    def read_header(self):
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError:
+            print("Reading {} requires the pyarrow package - install it with \"pip3 install pyarrow\". Aborting."
+                  .format(self.fname))
+            sys.exit(0)
+        self.source = pyarrow.memory_map(self.fname)
+        try:
+            self.table = pyarrow.ipc.open_file(self.source).read_all()
+        except pyarrow.ArrowInvalid:
+            # Not the file format, so try the stream format
+            self.source.seek(0)
+            try:
+                self.table = pyarrow.ipc.open_stream(self.source).read_all()
+            except (pyarrow.ArrowInvalid, OSError):  # e.g. Feather v1, or a truncated stream
+                self.source.close()
+                print("{} is not an Arrow IPC file or stream (Feather v1 files aren't supported). Aborting."
+                      .format(self.fname))
+                sys.exit(0)
+        return self.table.column_names
+
+    def read_column(self, idx):
+        # Nulls become NaN (or None for non-numeric columns, which convert_column then turns into NaN)
+        return self.table.column(idx).to_numpy()
+
+    def close(self):
+        self.source.close()
+
+
+READERS = dict(text=TextReader, mmap=MmapReader)
+# Readers of binary columnar formats, by file extension. Other files are read as CSV with the --reader backend.
+FORMATS = {'.npz': NpzReader, '.arrow': ArrowReader, '.arrows': ArrowReader, '.feather': ArrowReader,
+           '.ipc': ArrowReader}
+
+
+def open_reader(fname, reader='mmap'):
+    """
+    Opens a file with the reader registered for its extension in FORMATS, or else as a CSV file with the given reader
+    backend ("mmap" or "text"). The header is read immediately.
+    """
+    reader_class = FORMATS.get(os.path.splitext(fname)[1])
+    return reader_class(fname) if reader_class else READERS[reader](fname)
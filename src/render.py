@@ -0,0 +1,35 @@
+# Size of exported images, in pixels
+IMAGE_WIDTH, IMAGE_HEIGHT = 1000, 750
+
+
+def export_images(jobs, image_format='png'):
+    """
+    Renders figures (plotly figures or dictionaries) to local image files (PNG or SVG) without network access, using
+    plotly's kaleido renderer.
+    jobs is a list of (figure, file path). All figures are exported in one batch, so the renderer only starts once.
+    Returns True if the images were written.
+    """
+    try:
+        import kaleido  # noqa: F401 (only checks that the renderer is installed)
+    except ImportError:
+        print("Exporting images requires the kaleido package - install it with \"pip3 install kaleido\". Aborting.")
+        return False
+    import plotly.io
+    figures, file_paths = [fig for fig, path in jobs], [path for fig, path in jobs]
+    print("Generating {} {} image(s)...".format(len(jobs), image_format.upper()), end='')
+    try:
+        if hasattr(plotly.io, 'write_images'):
+            plotly.io.write_images(figures, file_paths, format=image_format, width=IMAGE_WIDTH, height=IMAGE_HEIGHT,
+                                   validate=False)
+        else:
+            # Older plotly versions keep a single kaleido process alive between calls
+            for fig, file_path in jobs:
+                plotly.io.write_image(fig, file_path, format=image_format, width=IMAGE_WIDTH, height=IMAGE_HEIGHT,
+                                      validate=False)
+    except (RuntimeError, ValueError) as error:
+        print("failed.\n{}\nAborting.".format(error))
+        return False
+    print("done.\n")
+    for file_path in file_paths:
+        print("See {}.".format(file_path))
+    return True
@@ -0,0 +1,175 @@
+import re
+import sys
+import warnings
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# A number, optionally followed by a time unit. Units assume the x-axis is in seconds.
+INTERVAL = re.compile(r'^\s*(?P<num>[0-9]*\.?[0-9]+)\s*(?P<unit>ms|s|min|m|h|d)?\s*$')
+UNITS = dict(ms=0.001, s=1, m=60, min=60, h=3600, d=86400)
+AGGS = ("mean", "min", "max", "sum", "count")
+
+
+def parse_interval(interval):
+    """
+    Converts a "--resample" interval such as "500ms", "1s", "5m" or "2.5" (in x-axis units) to x-axis units.
+    """
+    match = INTERVAL.match(interval)
+    if not match or float(match.group('num')) <= 0:
+        print("You didn't use --resample correctly. Use a positive number, optionally followed by ms, s, m, h or d "
+              "(e.g. \"1s\").")
+        sys.exit(0)
+    return float(match.group('num')) * UNITS[match.group('unit') or 's']
+
+
+def check_agg(agg):
+    """
+    Makes sure "--agg" is mean, min, max, sum, count or a percentile such as p99.
+    """
+    try:
+        valid = agg in AGGS or (agg.startswith('p') and 0 <= float(agg[1:]) <= 100)
+    except ValueError:
+        valid = False
+    if not valid:
+        print("You didn't use --agg correctly. Use mean, min, max, sum, count, or a percentile from p0 to p100.")
+        sys.exit(0)
+    return agg
+
+
+class Resampler:
+    """
+    Reduces parsed columns before col operations: "--resample" aggregates all rows whose x-axis value falls in the same
+    interval (aligned to multiples of it) into one point, labeled with the start of the interval. "--rolling N" then
+    replaces every point with the aggregate of the last N points. Both use "--agg" and ignore NaN values.
+    Chunks of a file can be processed one after another: rows of the last (possibly incomplete) interval, and the last
+    N-1 points needed by the next rolling windows, are carried over to the next chunk. Streamed rows are expected in
+    x-axis order.
+    EXAMPLE USAGE: Resampler("timestamp", interval=1.0, agg="p99").process(data, final=True)
+    """
+    def __init__(self, xaxis, interval=None, agg="mean", rolling=None):
+        self.xaxis, self.interval, self.agg, self.rolling = xaxis, interval, agg, rolling
+        # Rows of the last interval of the previous chunk, which may continue in the next chunk
+        self.carry = None
+        # Last rolling-1 points of the previous chunk, so windows can span chunks
+        self.tail = None
+
+    def process(self, chunk, final=False):
+        """
+        Returns a chunk (dictionary of column arrays) resampled and/or rolled. If final is not set, the rows of its last
+        interval are kept for the next call instead of being aggregated.
+        """
+        if self.interval:
+            chunk = self.join(self.carry, chunk)
+            x_vals = chunk[self.xaxis]
+            chunk = {field: values[~np.isnan(x_vals)] for field, values in chunk.items()}
+            bins = np.floor(chunk[self.xaxis] / self.interval)
+            self.carry = None
+            if not final and len(bins):
+                done = bins < bins[-1]
+                self.carry = {field: values[~done] for field, values in chunk.items()}
+                chunk, bins = {field: values[done] for field, values in chunk.items()}, bins[done]
+            chunk = self.resample(chunk, bins)
+        if self.rolling:
+            chunk = self.join(self.tail, chunk)
+            self.tail = {field: values[len(values) - min(len(values), self.rolling - 1):]
+                         for field, values in chunk.items()}
+            chunk = self.roll(chunk)
+        return chunk
+
+    def iter_chunks(self, chunks, final=True):
+        """
+        Processes a sequence of chunks. If final is set, the carried over rows are aggregated after the last chunk.
+        """
+        empty = None
+        for chunk in chunks:
+            yield self.process(chunk)
+            empty = {field: values[:0] for field, values in chunk.items()}
+        if final and empty is not None:
+            yield self.process(empty, final=True)
+
+    @staticmethod
+    def join(first, second):
+        if first is None:
+            return second
+        return {field: np.concatenate((first[field], values)) for field, values in second.items()}
+
+    def resample(self, chunk, bins):
+        """
+        Aggregates the rows of each interval (bins holds the interval number of every row).
+        """
+        if len(bins) > 1 and np.any(bins[1:] < bins[:-1]):
+            order = np.argsort(bins, kind='stable')
+            chunk, bins = {field: values[order] for field, values in chunk.items()}, bins[order]
+        starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1]))) if len(bins) else np.empty(0, int)
+        resampled = dict()
+        for field, values in chunk.items():
+            if field == self.xaxis:
+                resampled[field] = bins[starts] * self.interval
+            else:
+                resampled[field] = self.aggregate(values, starts)
+        return resampled
+
+    def aggregate(self, values, starts):
+        """
+        Returns the aggregate of each segment of values (each segment begins at one of starts).
+        """
+        if not len(starts):
+            return np.empty(0)
+        nans = np.isnan(values)
+        counts = np.add.reduceat(~nans, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.agg == 'count':
+                return counts.astype(np.float64)
+            if self.agg in ('sum', 'mean'):
+                sums = np.add.reduceat(np.where(nans, 0, values), starts)
+                return np.where(counts > 0, sums if self.agg == 'sum' else sums / counts, np.nan)
+            if self.agg == 'min':
+                return np.fmin.reduceat(values, starts)
+            if self.agg == 'max':
+                return np.fmax.reduceat(values, starts)
+            # Percentile: sort each segment (NaN last), then interpolate between the closest ranks like np.percentile.
+            # Sorting by (segment, rank of the value) as a single integer key is much faster than np.lexsort.
+            segments = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+            ranks = np.empty(len(values), dtype=np.int64)
+            ranks[np.argsort(values)] = np.arange(len(values))
+            ordered = values[np.argsort(segments * np.int64(len(values)) + ranks)]
+            ranks = (counts - 1) * float(self.agg[1:]) / 100
+            low, high = starts + np.floor(ranks).astype(int), starts + np.ceil(ranks).astype(int)
+            low, high = np.maximum(low, starts), np.maximum(high, starts)
+            result = ordered[low] + (ordered[high] - ordered[low]) * (ranks - np.floor(ranks))
+            return np.where(counts > 0, result, np.nan)
+
+    def roll(self, chunk):
+        """
+        Replaces each point by the aggregate of the window of the last N points. The first N-1 points have no full
+        window, so they are dropped. x-axis values are those of the last point of each window.
+        """
+        size = self.rolling
+        rolled = dict()
+        for field, values in chunk.items():
+            if len(values) < size:
+                rolled[field] = values[:0]
+            elif field == self.xaxis:
+                rolled[field] = values[size - 1:]
+            elif self.agg in ('sum', 'mean', 'count'):
+                # Window sums from cumulative sums, so the cost doesn't depend on N
+                nans = np.isnan(values)
+                sums = np.cumsum(np.concatenate(([0], np.where(nans, 0, values))))
+                counts = np.cumsum(np.concatenate(([0], ~nans)))
+                sums, counts = sums[size:] - sums[:-size], counts[size:] - counts[:-size]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    if self.agg == 'count':
+                        rolled[field] = counts.astype(np.float64)
+                    else:
+                        rolled[field] = np.where(counts > 0, sums if self.agg == 'sum' else sums / counts, np.nan)
+            else:
+                windows = sliding_window_view(values, size)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)  # Windows of only NaN values are NaN
+                    if self.agg == 'min':
+                        rolled[field] = np.nanmin(windows, axis=1)
+                    elif self.agg == 'max':
+                        rolled[field] = np.nanmax(windows, axis=1)
+                    else:
+                        rolled[field] = np.nanpercentile(windows, float(self.agg[1:]), axis=1)
+        return rolled
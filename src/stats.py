@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class ColumnStats:
+    """
+    Summary (min, max and count of non-NaN values) of a single column, so axis ranges never rescan the values.
+    Stats of chunks can be merged, and are transformed (rather than recomputed) when modifiers are applied.
+    EXAMPLE USAGE: test_csv.stats["core-0"].max
+    """
+    def __init__(self, min_val=np.inf, max_val=-np.inf, count=0):
+        self.min, self.max, self.count = min_val, max_val, count
+
+    @classmethod
+    def of(cls, values):
+        """
+        Computes the stats of an array of values.
+        """
+        count = int(np.count_nonzero(~np.isnan(values))) if len(values) else 0
+        if not count:
+            return cls()
+        return cls(float(np.nanmin(values)), float(np.nanmax(values)), count)
+
+    def merge(self, other):
+        """
+        Returns the stats of both columns (or chunks of a column) combined.
+        """
+        return ColumnStats(min(self.min, other.min), max(self.max, other.max), self.count + other.count)
+
+    def transform(self, func):
+        """
+        Returns the stats after applying a monotonic function (e.g. scale and offset) to every value.
+        """
+        if not self.count:
+            return self
+        new_min, new_max = sorted([func(self.min), func(self.max)])
+        return ColumnStats(new_min, new_max, self.count)
+
+    def __repr__(self):
+        return "ColumnStats(min={}, max={}, count={})".format(self.min, self.max, self.count)
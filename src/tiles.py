@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+from .downsample import minmax
+from .export import encode_array, decode_array, write_page
+
+# Points of the coarsest level of each trace, which is the only level embedded in the HTML
+BASE_POINTS = 2000
+# Points per tile file
+TILE_POINTS = 4096
+# The viewer shows the finest level that has at most this many points per trace in the visible x-range
+VISIBLE_POINTS = 4000
+
+# Tile files are scripts rather than binary files, since browsers don't allow reading local files from file:// pages
+TILE_TEMPLATE = 'csvplotTile("{key}", {x}, {y});\n'
+
+# Added to the page of export.py (which decodes the figure): shows the finest level of each pyramid that fits the
+# visible x-range, loading its tiles on demand, whenever the x-axis is zoomed or panned
+VIEWER_SCRIPT = """        // Trace index => levels (coarsest first) => tiles ({{key, file, x0, x1}}),
+        // and the density of each level
+        var pyramids = {pyramids};
+        var visiblePoints = {visible_points};
+        var loaded = {{}}, waiting = {{}}, latest = 0;
+        // Called by every tile script once it is loaded
+        function csvplotTile(key, x, y) {{
+            loaded[key] = {{x: decode(x), y: decode(y)}};
+            (waiting[key] || []).forEach(function (callback) {{
+                callback();
+            }});
+            delete waiting[key];
+        }}
+        function loadTile(tile, callback) {{
+            if (loaded[tile.key]) {{
+                return callback();
+            }}
+            if (waiting[tile.key]) {{
+                return waiting[tile.key].push(callback);
+            }}
+            waiting[tile.key] = [callback];
+            var script = document.createElement("script");
+            script.src = tile.file;
+            document.head.appendChild(script);
+        }}
+        function concat(arrays) {{
+            var length = arrays.reduce(function (total, array) {{ return total + array.length; }}, 0);
+            var result = new Float64Array(length), offset = 0;
+            arrays.forEach(function (array) {{
+                result.set(array, offset);
+                offset += array.length;
+            }});
+            return result;
+        }}
+        // Loads the tiles of the finest level that fits the visible x-range (all of it if range is null) and shows them
+        function show(range) {{
+            var request = ++latest;
+            Object.keys(pyramids).forEach(function (index) {{
+                var pyramid = pyramids[index], level = 0;
+                if (range) {{
+                    while (level + 1 < pyramid.levels.length &&
+                           pyramid.density[level + 1] * (range[1] - range[0]) <= visiblePoints) {{
+                        level++;
+                    }}
+                }}
+                var tiles = pyramid.levels[level].filter(function (tile) {{
+                    return !range || (tile.x1 >= range[0] && tile.x0 <= range[1]);
+                }});
+                var remaining = tiles.length;
+                tiles.forEach(function (tile) {{
+                    loadTile(tile, function () {{
+                        if (--remaining > 0 || request !== latest) {{
+                            return;
+                        }}
+                        var data = tiles.map(function (tile) {{ return loaded[tile.key]; }});
+                        Plotly.restyle("plot", {{
+                            x: [concat(data.map(function (part) {{ return part.x; }}))],
+                            y: [concat(data.map(function (part) {{ return part.y; }}))]
+                        }}, [Number(index)]);
+                    }});
+                }});
+            }});
+        }}
+        Plotly.newPlot("plot", figure.data, figure.layout, {{"responsive": true}}).then(function (plot) {{
+            plot.on("plotly_relayout", function (event) {{
+                if (event["xaxis.autorange"]) {{
+                    show(null);
+                }} else if ("xaxis.range[0]" in event) {{
+                    show([event["xaxis.range[0]"], event["xaxis.range[1]"]]);
+                }} else if (event["xaxis.range"]) {{
+                    show(event["xaxis.range"]);
+                }}
+            }});
+        }});"""
+
+
+def build_pyramid(x_vals, y_vals, base_points=BASE_POINTS):
+    """
+    Returns the levels of a min/max pyramid of a trace, coarsest first: (x, y) arrays of base_points points, then twice
+    as many at every level. The finest level is the trace itself (levels with more than half of its points are skipped).
+    """
+    x_vals, y_vals = decode_array(x_vals), decode_array(y_vals)
+    levels, points = [], base_points
+    while points * 2 <= len(x_vals):
+        levels.append(minmax(x_vals, y_vals, points))
+        points *= 2
+    levels.append((x_vals, y_vals))
+    return levels
+
+
+def write_tiled_html(fig, file_path, dtype="float32", base_points=BASE_POINTS, tile_points=TILE_POINTS):
+    """
+    Writes a figure as HTML that embeds only the coarsest level of each line trace with more than base_points points.
+    Every level of the trace's min/max pyramid is split into tiles of tile_points points, written as small scripts to
+    a "<name>_tiles" directory next to the HTML. When zooming, the page loads only the tiles of the finest level that
+    fits the visible x-range, so no server is needed and the initial page stays small whatever the size of the data.
+    Like --compact, the page references a single plotly.min.js shared by all plots in the same directory.
+    """
+    out_dir = os.path.dirname(file_path)
+    tiles_name = "{}_tiles".format(os.path.splitext(os.path.basename(file_path))[0])
+    tiles_dir = os.path.join(out_dir, tiles_name)
+    fig_dict = fig if isinstance(fig, dict) else fig.to_plotly_json()
+    data, pyramids = [], dict()
+    for index, trace in enumerate(fig_dict["data"]):
+        trace = dict(trace)
+        if trace.get("type", "scatter") == "scatter" and trace.get("y") is not None and len(trace["y"]) > base_points:
+            levels = build_pyramid(trace["x"], trace["y"], base_points)
+            pyramids[index] = write_tiles(levels, tiles_dir, tiles_name, "t{}".format(index), dtype, tile_points)
+            trace["x"], trace["y"] = levels[0]
+        data.append(trace)
+    script = VIEWER_SCRIPT.format(pyramids=json.dumps(pyramids), visible_points=VISIBLE_POINTS)
+    write_page(file_path, data, fig_dict.get("layout", {}), dtype, script)
+
+
+def write_tiles(levels, tiles_dir, tiles_name, prefix, dtype, tile_points):
+    """
+    Writes every level of a pyramid as tiles. Returns the index used by the viewer: the tiles of each level (with the
+    x-range they cover) and the density (points per x-axis unit) of each level.
+    """
+    if not os.path.exists(tiles_dir):
+        os.makedirs(tiles_dir)
+    index = dict(levels=[], density=[])
+    for level, (x_vals, y_vals) in enumerate(levels):
+        tiles = []
+        for start in range(0, len(x_vals), tile_points):
+            key = "{}_l{}_{}".format(prefix, level, start // tile_points)
+            tile_x, tile_y = x_vals[start:start + tile_points], y_vals[start:start + tile_points]
+            with open(os.path.join(tiles_dir, key + ".js"), "w") as tile_file:
+                tile_file.write(TILE_TEMPLATE.format(key=key, x=json.dumps(encode_array(tile_x, "float32", True)),
+                                                     y=json.dumps(encode_array(tile_y, dtype))))
+            tiles.append(dict(key=key, file="{}/{}.js".format(tiles_name, key), x0=float(np.nanmin(tile_x)),
+                              x1=float(np.nanmax(tile_x))))
+        x_span = float(np.nanmax(x_vals) - np.nanmin(x_vals)) if len(x_vals) else 0.0
+        index["levels"].append(tiles)
+        index["density"].append(len(x_vals) / x_span if x_span else float(len(x_vals)))
+    return index
@@ -1,6 +1,31 @@
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
 import unittest
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
 from src import Plotter
-from runme import get_csv_list, get_arguments
+from src import profiler
+from src.convert import ConversionSummary, convert_column, convert_distinct, to_text
+from src.headers import HeaderIndex
+from src.readers import MmapReader
+from src.downsample import downsample
+from src.export import decode_array, encode_array
+from src.tiles import write_tiled_html
+from runme import get_csv_list, get_arguments, generate_plots, generate_individual_plots, get_profile_path
+from runmanifest import get_plot_args, parse_shared, derive_csv
+from benchmark import generate_csv, run_pipeline, run_trace_benchmark
 
 
 class TestCSVPlotter(unittest.TestCase):
@@ -39,6 +64,538 @@ class TestCSVPlotter(unittest.TestCase):
         self.assertEqual(len(csv.data['timestamp']), 1)
         self.assertEqual(csv.data['timestamp'][0], 8.0)
 
+    # Check that columns are stored as float64 arrays and that col operations reduce whole columns
+    def test_csv_col_ops_columnar(self):
+        args = get_arguments(['-f', 'ex*/my*/cat*', '-c', 'hunger,timestamp', '-s', '-M'])
+        csv = get_csv_list(args)[0]
+        self.assertEqual(csv.data['sum_hunger/timestamp'].dtype, 'float64')
+        self.assertEqual(csv.data['sum_hunger/timestamp'][5], 15.0)
+        self.assertEqual(csv.data['max_hunger/timestamp'][-1], 30.0)
+
+    # Check that extra reductions (std, count, percentiles) are computed per column group
+    def test_csv_col_ops_extra_reductions(self):
+        args = get_arguments(['-f', 'ex*/my*/cat*', '-c', 'hunger,timestamp', '--std', '--count', '--pct', '50,100'])
+        csv = get_csv_list(args)[0]
+        self.assertEqual(list(csv.data), ['std_hunger/timestamp', 'count_hunger/timestamp', 'p50_hunger/timestamp',
+                                          'p100_hunger/timestamp'])
+        self.assertEqual(csv.data['std_hunger/timestamp'][5], 2.5)
+        self.assertEqual(csv.data['count_hunger/timestamp'][0], 2.0)
+        self.assertEqual(csv.data['p50_hunger/timestamp'][5], 7.5)
+        self.assertEqual(csv.data['p100_hunger/timestamp'][5], 10.0)
+
+    # Check that streaming in small chunks gives the same columns as parsing the whole file at once
+    def test_csv_parsing_chunked(self):
+        base = ['-f', 'ex*/my*/dog*', '-c', 'hunger,timestamp', '-a', '-S', '2', '--col_eq_val', 'name=buttons']
+        whole = get_csv_list(get_arguments(base))[0]
+        chunked = get_csv_list(get_arguments(base + ['--chunk_rows', '2']))[0]
+        self.assertEqual(list(chunked.data), list(whole.data))
+        self.assertEqual(chunked.numrows, whole.numrows)
+        self.assertEqual(list(chunked.data['avg_hunger/timestamp']), list(whole.data['avg_hunger/timestamp']))
+
+    # Check that both downsampling methods shrink a trace to the target size but keep its peaks and end points
+    def test_downsample_keeps_peaks(self):
+        x_vals, y_vals = list(range(1000)), [0.0] * 1000
+        y_vals[337], y_vals[600] = 50.0, -20.0
+        for method in ('lttb', 'minmax'):
+            ds_x, ds_y = downsample(x_vals, y_vals, 50, method)
+            self.assertLessEqual(len(ds_x), 50)
+            self.assertIn(337, ds_x)
+            self.assertEqual((max(ds_y), min(ds_y)), (50.0, -20.0))
+            self.assertEqual((ds_x[0], ds_x[-1]), (0, 999))
+
+    # Check that --max_points below what the --downsample method can reduce a trace to is rejected
+    def test_max_points_minimum(self):
+        base = ['-d', 'foo', '-c', 'bar', '--max_points']
+        self.assertEqual(get_arguments(base + ['3']).max_points, 3)
+        for extra in (['2'], ['3', '--downsample', 'minmax']):
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                get_arguments(base + extra)
+
+    # Check that options taking a number of rows, points or processes only accept positive integers
+    def test_positive_int_options(self):
+        base = ['-d', 'foo', '-c', 'bar']
+        self.assertEqual(get_arguments(base + ['--chunk_rows', '100', '-j', '2']).chunk_rows, 100)
+        for option, value in itertools.product(('--chunk_rows', '--max_points', '--jobs'), ('0', '-5', '1.5', 'x')):
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                get_arguments(base + [option, value])
+
+    # Check that the console bar graph is shown for traces that have 15 points or less once downsampled
+    def test_histogram_after_downsampling(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'long.csv')
+            generate_csv(fname, 40, 1)
+            for extra, shown in (([], False), (['--max_points', '10'], True), (['--max_points', '20'], False)):
+                args = get_arguments(['-f', fname, '-c', 'val-*', '--xaxis', 'timestamp', '-D', tmp_dir] + extra)
+                csv_list = get_csv_list(args)
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    Plotter(args, csv_list).create_plot_data(csv_list)
+                self.assertEqual('Trace:' in output.getvalue(), shown, extra)
+
+    # Check that parsing in a process pool keeps the sorted file order and gives the same data
+    def test_csv_parsing_parallel(self):
+        base = ['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp']
+        serial = get_csv_list(get_arguments(base))
+        parallel = get_csv_list(get_arguments(base + ['-j', '2']))
+        self.assertEqual([x.fname for x in parallel], [x.fname for x in serial])
+        self.assertEqual([x.fname.endswith('cat_hunger.csv') for x in parallel], [True, False])
+        self.assertEqual(list(parallel[1].data['hunger']), list(serial[1].data['hunger']))
+
+    # Check that a warm cache returns the same (memory-mapped) columns, and that a new column selection is a new entry
+    def test_csv_parsing_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            base = ['-f', 'ex*/my*/dog*', '-c', 'hunger', '--xaxis', 'timestamp', '--cache', '--cache_dir', cache_dir]
+            cold = get_csv_list(get_arguments(base))[0]
+            warm = get_csv_list(get_arguments(base))[0]
+            self.assertEqual(sorted(os.listdir(cache_dir))[-1], "headers")
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+            self.assertTrue(hasattr(warm.data['timestamp'], 'filename'))
+            self.assertEqual(list(warm.data['hunger']), list(cold.data['hunger']))
+            get_csv_list(get_arguments(base + ['--col_eq_val', 'name=buttons']))
+            self.assertEqual(len(os.listdir(cache_dir)), 5)
+
+    # Check that parallel workers can create and fill a new cache directory at the same time
+    def test_csv_parsing_cache_parallel(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            for num in range(16):
+                generate_csv(os.path.join(data_dir, 'run{:02d}.csv'.format(num)), 50, 3, seed=num)
+            cache_dir = os.path.join(data_dir, 'cache')
+            args = get_arguments(['-d', data_dir, '-c', 'val-*', '-s', '--cache', '--cache_dir', cache_dir, '-j', '16'])
+            cold = get_csv_list(args)
+            warm = get_csv_list(args)
+            self.assertEqual(len([fname for fname in os.listdir(cache_dir) if fname.endswith('.npy')]), 16)
+            self.assertEqual([fname for fname in os.listdir(cache_dir) if fname.endswith('.tmp')], [])
+            self.assertEqual([list(csv.data['sum_val-*']) for csv in warm],
+                             [list(csv.data['sum_val-*']) for csv in cold])
+
+    # Check that a column is converted in bulk, with SI units applied and junk values stored as NaN
+    def test_convert_column(self):
+        values, summary = convert_column(['1', '2.4K', '1.1 M', '4 dogy hunger points', 'n/a'])
+        self.assertEqual(list(values[:4]), [1.0, 2400.0, 1100000.0, 4.0])
+        self.assertNotEqual(values[4], values[4])
+        self.assertEqual((summary.units, summary.junk), (3, 1))
+
+    # Check that a column with many SI values is converted in bulk, no slower than parsing each distinct value
+    def test_convert_column_si_speed(self):
+        rng = np.random.default_rng(0)
+        values = rng.uniform(0, 100, 200000).round(3).astype(str).astype(object)
+        with_unit = rng.random(len(values)) < 0.2
+        values[with_unit] = [value + 'K' for value in values[with_unit]]
+        values = np.array(values.tolist()).astype(np.bytes_)
+        start = time.perf_counter()
+        converted, summary = convert_column(values)
+        bulk_time = time.perf_counter() - start
+        start = time.perf_counter()
+        expected, _ = convert_distinct(to_text(values), ConversionSummary())
+        self.assertLessEqual(bulk_time, time.perf_counter() - start)
+        self.assertTrue(np.allclose(converted, expected))
+        self.assertEqual((summary.units, summary.junk), (int(with_unit.sum()), 0))
+
+    # Check that the filter language supports !=, <, >, ranges, sets and '|'
+    def test_csv_parsing_dog_col_filter_expressions(self):
+        expected = {'name!=buttons': 6, 'timestamp<3': 3, 'timestamp>=10': 2, 'timestamp=2..4': 3,
+                    'name in {boney, buttons}': 12, 'name=boney&timestamp>4|timestamp=10': 2,
+                    'timestamp=0|timestamp=10.5': 2}
+        for expression, numrows in expected.items():
+            args = get_arguments(['-f', 'ex*/my*/dog*', '-c', 'hunger', '--xaxis', 'timestamp',
+                                  '--col_eq_val', expression])
+            csv = get_csv_list(args)[0]
+            self.assertEqual(csv.numrows, numrows, expression)
+
+    # Check that only the selected columns are extracted from wide rows, and rows with the wrong field count are skipped
+    def test_csv_parsing_projection(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'wide.csv')
+            with open(fname, 'w') as csv_file:
+                csv_file.write('a,b,c,d,e\n1,x,2,y,z\n3,x,4,y,z\n5,x,6,y\n7,x,8,y,z,extra\n9,x,10,y,z')
+            csv = get_csv_list(get_arguments(['-f', fname, '-c', 'c', '--xaxis', 'a']))[0]
+            self.assertEqual(list(csv.data), ['c', 'a'])
+            self.assertEqual(list(csv.data['a']), [1.0, 3.0, 9.0])
+            self.assertEqual(list(csv.data['c']), [2.0, 4.0, 10.0])
+
+    # Check that the memory-mapped and text readers parse the same rows, skipping the same bad rows, comments and blank
+    # lines (also in single-column files)
+    def test_csv_parsing_readers_match(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname, single = os.path.join(tmp_dir, 'crlf.csv'), os.path.join(tmp_dir, 'single.csv')
+            with open(fname, 'wb') as csv_file:
+                csv_file.write(b'\r\n# comment\r\nname, a ,b\r\nx,1,2K\r\n#y,3,4\r\n,5,6\r\nz , 7,8\r\nw,9')
+            with open(single, 'wb') as csv_file:
+                csv_file.write(b'a\n1\n\n2\r\n\r\n#3\n4\n\n')
+            for fpath, cols in [('ex*/my*/dog*', 'hunger,timestamp'), ('ex*/my*/cat*', 'hunger,timestamp'),
+                                (fname, 'a,b'), (single, 'a')]:
+                parsed = [get_csv_list(get_arguments(['-f', fpath, '-c', cols, '--reader', reader]))[0]
+                          for reader in ('text', 'mmap')]
+                self.assertEqual(list(parsed[0].data), list(parsed[1].data))
+                for field in parsed[0].data:
+                    self.assertEqual(list(parsed[0].data[field]), list(parsed[1].data[field]))
+                if fpath == fname:
+                    self.assertEqual(list(parsed[1].data['b']), [2000.0, 8.0])
+            self.assertEqual(list(parsed[0].data['a']), [1.0, 2.0, 4.0])
+
+    # Check that empty and comment-only files in a directory are reported and skipped, rather than ending the batch
+    def test_csv_parsing_no_header_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            open(os.path.join(tmp_dir, 'a_empty.csv'), 'w').close()
+            with open(os.path.join(tmp_dir, 'b_comments.csv'), 'w') as csv_file:
+                csv_file.write('# no header\n\n# yet\n')
+            with open(os.path.join(tmp_dir, 'c_data.csv'), 'w') as csv_file:
+                csv_file.write('t,a\n1,5\n')
+            for reader, cache in itertools.product(('text', 'mmap'), ([], ['--cache_dir', tmp_dir, '--cache'])):
+                csv_list = get_csv_list(get_arguments(['-d', tmp_dir, '-c', 'a', '--reader', reader] + cache))
+                self.assertEqual([os.path.basename(csv.fname) for csv in csv_list], ['c_data.csv'])
+            with self.assertRaises(SystemExit):
+                get_csv_list(get_arguments(['-f', os.path.join(tmp_dir, 'a_empty.csv'), '-c', 'a']))
+
+    # Check that small chunks split each scanned window (instead of rescanning it), and match across window edges
+    def test_csv_parsing_mmap_small_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'small_chunks.csv')
+            generate_csv(fname, 20000, 1, bad_every=500, si_fraction=0)
+            base = ['-f', fname, '-c', 'val-0', '--xaxis', 'timestamp']
+            whole = get_csv_list(get_arguments(base))[0]
+            # Count the bytes every chunk is parsed from, which must add up to the file (not to a window per chunk)
+            scanned, parse_lines = [], MmapReader.parse_lines
+            window_bytes = MmapReader.WINDOW_BYTES
+            MmapReader.parse_lines = lambda reader, block, *args: scanned.append(len(block)) or \
+                parse_lines(reader, block, *args)
+            try:
+                chunked = [get_csv_list(get_arguments(base + ['--chunk_rows', '50']))[0]]
+                self.assertLessEqual(sum(scanned), os.path.getsize(fname))
+                MmapReader.WINDOW_BYTES = 4096
+                chunked.append(get_csv_list(get_arguments(base + ['--chunk_rows', '997']))[0])
+            finally:
+                MmapReader.parse_lines, MmapReader.WINDOW_BYTES = parse_lines, window_bytes
+            for csv in chunked:
+                self.assertEqual(csv.numrows, whole.numrows)
+                self.assertTrue(np.array_equal(csv.data['val-0'], whole.data['val-0']))
+
+    # Check that column stats are kept at ingest and follow the modifiers, in both whole-file and streaming mode
+    def test_csv_stats(self):
+        base = ['-f', 'ex*/my*/cat*', '-c', 'hunger', '--xaxis', 'timestamp', '-S', '-2', '-o', '5']
+        for extra in ([], ['--chunk_rows', '3']):
+            csv = get_csv_list(get_arguments(base + extra))[0]
+            for field, values in csv.data.items():
+                self.assertEqual((csv.stats[field].min, csv.stats[field].max, csv.stats[field].count),
+                                 (min(values), max(values), len(values)))
+            self.assertEqual(csv.stats['hunger'].min, -55.0)
+            self.assertEqual(Plotter.get_x_max([csv], 'timestamp'), 13.0)
+
+    # Check that compact HTML output shares one plotly.min.js, and that typed arrays keep x-values exact
+    def test_plotter_compact_html(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '-C', '-i', '-D', out_dir])
+            generate_individual_plots(args, get_csv_list(args))
+            self.assertEqual(sorted(os.listdir(out_dir)), ['cat_hunger.html', 'dog_hunger.html', 'plotly.min.js'])
+        self.assertEqual(encode_array([0.5, 1.0], 'float32')['dtype'], 'f4')
+        self.assertEqual(encode_array([1700000000.5], 'float32', lossless=True)['dtype'], 'f8')
+        self.assertEqual(list(decode_array(encode_array([1700000000.5], 'float32', lossless=True))), [1700000000.5])
+
+    # Check that individual plots rendered in parallel share global axes, and that args aren't modified
+    def test_individual_plots_parallel(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '-i', '-C', '-j', '2',
+                                  '-o', '1', '-D', out_dir])
+            generate_individual_plots(args, get_csv_list(args))
+            self.assertEqual(sorted(os.listdir(out_dir)), ['cat_hunger.html', 'dog_hunger.html', 'plotly.min.js'])
+            with open(os.path.join(out_dir, 'cat_hunger.html')) as html_file:
+                self.assertIn('"range":[1.0,', html_file.read().replace(' ', ''))
+        self.assertEqual((args.dir, args.file), ('ex*/my*', None))
+
+    # Check that plots derived from columns shared by a manifest match plots parsed on their own
+    def test_manifest_shared_parsing(self):
+        manifest = dict(file='ex*/my*/dog*', args=['--xaxis', 'timestamp'],
+                        plots=[dict(args=['-c', 'hunger', '--col_eq_val', 'name=buttons']),
+                               dict(args=['-c', 'hunger,timestamp', '-a', '-S', '2'])])
+        plot_args = get_plot_args(manifest)
+        fpath = get_csv_list(plot_args[0])[0].fname
+        shared = parse_shared(fpath, plot_args, 'mmap')
+        self.assertEqual(sorted(shared[1]), ['hunger', 'timestamp'])
+        self.assertEqual(list(shared[2]), ['name'])
+        for args in plot_args:
+            derived, parsed = derive_csv(fpath, shared, args), get_csv_list(args)[0]
+            self.assertEqual(list(derived.data), list(parsed.data))
+            for field in parsed.data:
+                self.assertEqual(list(derived.data[field]), list(parsed.data[field]))
+
+    # Check that --follow only parses appended rows, waits for a line to be complete, and updates ops and stats
+    def test_csv_follow(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'live.csv')
+            with open(fname, 'w') as csv_file:
+                csv_file.write('t,a,b\n1,1,2\n2,3,4\n3,5')
+            args = get_arguments(['-f', fname, '-c', 'a,b', '--xaxis', 't', '-s', '--follow'])
+            csv = get_csv_list(args)[0]
+            self.assertEqual(list(csv.data['sum_a/b']), [3.0, 7.0])
+            with open(fname, 'a') as csv_file:
+                csv_file.write(',6\nbad\n4,7,8\n5,9')
+            self.assertEqual(csv.update(args), 2)
+            self.assertEqual(csv.update(args), 0)
+            self.assertEqual(list(csv.data['sum_a/b']), [3.0, 7.0, 11.0, 15.0])
+            self.assertEqual((csv.stats['sum_a/b'].max, csv.stats['t'].count, csv.numrows), (15.0, 4, 4))
+            with open(fname, 'w') as csv_file:
+                csv_file.write('t,a,b\n1,0,1\n')
+            self.assertEqual(csv.update(args), 1)
+            self.assertEqual(list(csv.data['sum_a/b']), [1.0])
+
+    # Check that --follow waits for rows on a file that only has a header so far, and plots once rows are appended
+    def test_csv_follow_header_only(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'collector.csv')
+            with open(fname, 'w') as csv_file:
+                csv_file.write('t,a\n')
+            args = get_arguments(['-f', fname, '-c', 'a', '--xaxis', 't', '--follow', '-D', tmp_dir])
+            csv_list = get_csv_list(args)
+            self.assertEqual(csv_list[0].numrows, 0)
+            self.assertIsNone(generate_plots(args, csv_list))
+            with open(fname, 'a') as csv_file:
+                csv_file.write('1,5\n2,6\n')
+            self.assertEqual(csv_list[0].update(args), 2)
+            self.assertEqual(generate_plots(args, csv_list), os.path.join(tmp_dir, 'collector.html'))
+
+    # Check that --follow keeps updating a file that is empty at startup, or truncated to 0 bytes, until it has rows
+    def test_csv_follow_no_header(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'rotated.csv')
+            open(fname, 'w').close()
+            args = get_arguments(['-d', tmp_dir, '-c', 'a', '--xaxis', 't', '--follow'])
+            csv = get_csv_list(args)[0]
+            self.assertEqual((csv.numrows, csv.update(args)), (0, 0))
+            with open(fname, 'w') as csv_file:
+                csv_file.write('t,a\n1,5\n2,6\n')
+            self.assertEqual(csv.update(args), 2)
+            open(fname, 'w').close()
+            self.assertEqual((csv.update(args), csv.numrows), (0, 0))
+            with open(fname, 'w') as csv_file:
+                csv_file.write('# restarted\nt,a\n3,7\n')
+            self.assertEqual(csv.update(args), 1)
+            self.assertEqual(list(csv.data['a']), [7.0])
+
+    # Check that synthetic benchmark files parse to the requested rows (skipping bad rows), and every stage is timed
+    def test_benchmark_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'synth.csv')
+            generate_csv(fname, 250, 3, bad_every=100)
+            args = get_arguments(['-f', fname, '-c', 'val-*', '--xaxis', 'timestamp', '-s', '-D', tmp_dir])
+            stages = run_pipeline(args, 250)
+            self.assertEqual([stage['stage'] for stage in stages],
+                             ['glob', 'parse', 'col_ops', 'modifiers', 'ranging', 'trace_build', 'html_write'])
+            # Options that change how files are parsed are used as by runme.py
+            self.assertEqual([stage['stage'] for stage in run_pipeline(get_arguments(
+                ['-f', fname, '-c', 'val-*', '--xaxis', 'timestamp', '--resample', '10', '-D', tmp_dir]), 250)][:3],
+                ['glob', 'parse', 'resample'])
+            self.assertEqual([stage['stage'] for stage in run_pipeline(get_arguments(
+                ['-f', fname, '-c', 'val-*', '--chunk_rows', '100', '-D', tmp_dir]), 250)][:3],
+                ['glob', 'parse', 'ranging'])
+            csv = get_csv_list(args)[0]
+            self.assertEqual(csv.numrows, 250)
+            self.assertEqual(list(csv.data['timestamp'][[0, -1]]), [0.0, 249.0])
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'synth.html')))
+
+    # Check that --profile records every stage of every file, calls hooks, and writes the report next to the plot
+    def test_profile_stages(self):
+        self.assertIs(profiler.stage('parse'), profiler.NULL_STAGE)
+        with tempfile.TemporaryDirectory() as out_dir:
+            args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '-C', '-D', out_dir])
+            finished = []
+            profiler.enable().add_hook(lambda record: finished.append(record['stage']))
+            try:
+                plot = Plotter(args, get_csv_list(args))
+                plot.generate_plot()
+                profiler.current.write_report(get_profile_path(args, plot.get_file_path()))
+            finally:
+                report = profiler.disable().get_report()
+            self.assertTrue(os.path.exists(os.path.join(out_dir, 'my_examples.profile.json')))
+        self.assertEqual(finished, ['glob'] + ['parse', 'col_ops', 'modifiers'] * 2 + ['ranging', 'trace_build',
+                                                                                       'html_write'])
+        self.assertEqual(report['totals']['parse']['count'], 2)
+        self.assertEqual(report['stages'][1]['rows'], 14)
+        self.assertGreaterEqual(report['stages'][1]['peak_alloc_mb'], 0)
+
+    # Check that stages run by --jobs worker processes (parsing, and rendering individual plots) are in the report
+    def test_profile_stages_parallel(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '-C', '-i', '-j', '2',
+                                  '-D', out_dir])
+            finished = []
+            profiler.enable().add_hook(lambda record: finished.append(record['stage']))
+            try:
+                generate_individual_plots(args, get_csv_list(args))
+            finally:
+                report = profiler.disable().get_report()
+        self.assertEqual(finished, ['glob'] + ['parse', 'col_ops', 'modifiers'] * 2 +
+                         ['ranging', 'ranging', 'trace_build', 'html_write', 'trace_build', 'html_write'])
+        self.assertEqual([record['file'].endswith('cat_hunger.csv') for record in report['stages'][1:7]],
+                         [True] * 3 + [False] * 3)
+        self.assertEqual(report['totals']['html_write']['count'], 2)
+        self.assertIsNone(profiler.current)
+
+    # Check that -h and parsing don't import plotly (only writing a figure does), within a startup time budget
+    def test_startup_lazy_plotly(self):
+        script = "\n".join([
+            "import sys, time",
+            "start = time.perf_counter()",
+            "from runme import get_arguments, get_csv_list",
+            "from src import Plotter",
+            "startup = time.perf_counter() - start",
+            "try:",
+            "    get_arguments(['-h'])",
+            "except SystemExit:",
+            "    pass",
+            "args = get_arguments(['-f', 'ex*/my*/cat*', '-c', 'hunger', '--xaxis', 'timestamp'])",
+            "csv_list = get_csv_list(args)",
+            "parsed = 'plotly' in sys.modules",
+            "Plotter(args, csv_list).generate_plot()",
+            "print(startup, parsed, 'plotly' in sys.modules)",
+        ])
+        with tempfile.TemporaryDirectory() as out_dir:
+            script = script.replace("'timestamp']", "'timestamp', '-D', {!r}]".format(out_dir))
+            output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        startup, parsed, plotted = output.split()[-3:]
+        self.assertLess(float(startup), 1.0)
+        self.assertEqual((parsed, plotted), ('False', 'True'))
+
+    # Check that resolved --cols patterns are kept per header fingerprint, in memory and in a sidecar for later runs
+    def test_header_index(self):
+        header = ['timestamp'] + ['core-{}'.format(num) for num in range(12)] + ['power', 'gpu-power']
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertEqual(HeaderIndex(cache_dir).resolve('core-1?;*power,timestamp', header),
+                             ['core-10', 'core-11', 'gpu-power', 'power', 'timestamp'])
+            self.assertEqual(HeaderIndex(cache_dir).resolve('core-[0-9]', header), ['core-{}'.format(num)
+                                                                                   for num in range(10)])
+            fingerprint = HeaderIndex.fingerprint(header)
+            del HeaderIndex.memory[fingerprint]
+            self.assertEqual(HeaderIndex(cache_dir).load(fingerprint),
+                             {'core-1?': [11, 12], '*power': [13, 14], 'timestamp': [0],
+                              'core-[0-9]': list(range(1, 11))})
+            HeaderIndex.memory[fingerprint] = {'power': [14]}
+            self.assertEqual(HeaderIndex().resolve('power', header), ['gpu-power'])
+            del HeaderIndex.memory[fingerprint]
+
+    # Check that many processes resolving patterns of the same header at once all store the sidecar safely
+    def test_header_index_parallel(self):
+        header = ['timestamp'] + ['parallel-{}'.format(num) for num in range(64)]
+        patterns = ['parallel-{}*'.format(num) for num in range(1, 7)] * 8
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with ProcessPoolExecutor(max_workers=16) as pool:
+                resolved = list(pool.map(HeaderIndex(cache_dir).resolve, patterns, itertools.repeat(header)))
+            self.assertEqual(resolved[0], ['parallel-1'] + ['parallel-1{}'.format(num) for num in range(10)])
+            fingerprint = HeaderIndex.fingerprint(header)
+            self.assertEqual(os.listdir(os.path.join(cache_dir, 'headers')), [fingerprint + '.json'])
+            self.assertEqual(set(HeaderIndex(cache_dir).load(fingerprint)) - set(patterns), set())
+
+    # Check that --resample and --rolling aggregate per interval/window, and give the same points when streamed
+    def test_csv_resample_rolling(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, 'samples.csv')
+            with open(fname, 'w') as csv_file:
+                csv_file.write('t,v\n0,1\n0.5,5\n1,2\n1.2,n/a\n1.7,9\n2.1,4\n3.5,3\n3.6,7\n')
+            base = ['-f', fname, '-c', 'v', '--xaxis', 't', '--resample', '1s']
+            csv = get_csv_list(get_arguments(base + ['--agg', 'max']))[0]
+            self.assertEqual(list(csv.data['t']), [0.0, 1.0, 2.0, 3.0])
+            self.assertEqual(list(csv.data['v']), [5.0, 9.0, 4.0, 7.0])
+            for extra in (['--agg', 'p50'], ['--agg', 'count'], ['--rolling', '2'], ['--agg', 'p99', '--rolling', '3']):
+                whole = get_csv_list(get_arguments(base + extra))[0]
+                streamed = get_csv_list(get_arguments(base + extra + ['--chunk_rows', '3']))[0]
+                self.assertEqual(list(streamed.data['t']), list(whole.data['t']), extra)
+                self.assertEqual(list(streamed.data['v']), list(whole.data['v']), extra)
+            self.assertEqual(list(whole.data['t']), [2.0, 3.0])
+            means = get_csv_list(get_arguments(base))[0]
+            self.assertEqual(list(means.data['v']), [3.0, 5.5, 4.0, 5.0])
+            rolled = get_csv_list(get_arguments(base + ['--rolling', '2']))[0]
+            self.assertEqual(list(rolled.data['v']), [4.25, 4.75, 4.5])
+
+    # Check that --xnorm leaves the parsed x column untouched, and that line extensions are two-point segments
+    def test_plotter_xnorm_extensions(self):
+        args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp'])
+        csv_list = get_csv_list(args)
+        timestamps = [list(csv.data['timestamp']) for csv in csv_list]
+        fig = Plotter(get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '--xnorm']),
+                      csv_list).create_figure()
+        self.assertEqual([list(csv.data['timestamp']) for csv in csv_list], timestamps)
+        self.assertEqual([trace['x'][-1] for trace in fig['data'][::2]], [100.0, 100.0])
+        fig = Plotter(args, csv_list).create_figure()
+        extensions = [list(trace['x']) for trace in fig['data'][1::2] if len(trace['x'])]
+        self.assertEqual(extensions, [[10.5, 13.0]])
+
+    # Check that traces are plain dictionaries sharing style dictionaries, and that the trace benchmark runs
+    def test_plotter_bulk_traces(self):
+        args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '-B'])
+        plot = Plotter(args, get_csv_list(args))
+        fig = plot.create_figure()
+        self.assertEqual([trace['type'] for trace in fig['data']], ['bar'] * 4)
+        self.assertEqual([trace['opacity'] for trace in fig['data']], [1.0, 0.5, 1.0, 0.5])
+        color = fig['data'][0]['marker']['color']
+        self.assertIs(fig['data'][0]['marker'], plot.get_style('bar', color)['marker'])
+        results = run_trace_benchmark([10, 120], rows=20, cols_per_file=50, repeat=1)
+        self.assertEqual([(result['traces'], result['files']) for result in results], [(10, 1), (120, 3)])
+
+    # Check that tiled HTML embeds only the coarsest level, and that the finest level's tiles hold every point
+    def test_plotter_tiles(self):
+        x_vals, y_vals = list(range(1000)), [(idx * 7) % 13 for idx in range(1000)]
+        fig = dict(data=[dict(type='scatter', x=x_vals, y=y_vals), dict(type='scatter', x=[0, 1], y=[2, 3])],
+                   layout=dict())
+        with tempfile.TemporaryDirectory() as out_dir:
+            write_tiled_html(fig, os.path.join(out_dir, 'plot.html'), 'float64', base_points=100, tile_points=300)
+            self.assertEqual(sorted(os.listdir(out_dir)), ['plot.html', 'plot_tiles', 'plotly.min.js'])
+            with open(os.path.join(out_dir, 'plot.html')) as html_file:
+                html = html_file.read()
+            pyramids = json.loads(html.split('var pyramids = ')[1].split(';\n')[0])
+            self.assertEqual(list(pyramids), ['0'])
+            self.assertEqual([len(level) for level in pyramids['0']['levels']], [1, 1, 2, 4])
+            finest = []
+            for tile in pyramids['0']['levels'][-1]:
+                with open(os.path.join(out_dir, tile['file'])) as tile_file:
+                    finest += json.loads('[{}]'.format(tile_file.read().split('(', 1)[1].rsplit(')', 1)[0]))[1:]
+            self.assertEqual(list(np.concatenate([decode_array(part) for part in finest[::2]])), x_vals)
+            self.assertEqual(list(np.concatenate([decode_array(part) for part in finest[1::2]])), y_vals)
+            args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '--xaxis', 'timestamp', '--tiles', '-D', out_dir])
+            Plotter(args, get_csv_list(args)).generate_plot()
+            self.assertTrue(os.path.exists(os.path.join(out_dir, 'my_examples.html')))
+
+    # Check that .npz files are found, projected and filtered like the same columns in a CSV, and dates become seconds
+    def test_csv_parsing_npz(self):
+        args = get_arguments(['-f', 'ex*/my*/dog*', '-c', 'hunger', '--xaxis', 'timestamp'])
+        columns = get_csv_list(args)[0].data
+        with tempfile.TemporaryDirectory() as data_dir:
+            np.savez(os.path.join(data_dir, 'dog.npz'), timestamp=columns['timestamp'], hunger=columns['hunger'],
+                     weight=np.arange(12), day=np.arange(12).astype('datetime64[D]'))
+            np.savez_compressed(os.path.join(data_dir, 'cat.npz'), timestamp=columns['timestamp'],
+                                hunger=columns['hunger'], day=np.arange(12).astype('datetime64[D]'))
+            args = get_arguments(['-d', data_dir, '-c', 'hung*', '--xaxis', 'timestamp'])
+            csv_list = get_csv_list(args)
+            self.assertEqual([os.path.basename(csv.fname) for csv in csv_list], ['cat.npz', 'dog.npz'])
+            for csv in csv_list:
+                self.assertEqual(sorted(csv.data), ['hunger', 'timestamp'])
+                self.assertEqual(list(csv.data['hunger']), list(columns['hunger']))
+            args = get_arguments(['-d', data_dir, '-c', 'hunger', '--xaxis', 'day',
+                                  '--col_eq_val', 'timestamp in {2,3}'])
+            for csv in get_csv_list(args):
+                self.assertEqual(list(csv.data['day']), [2 * 86400.0, 3 * 86400.0])
+                self.assertEqual(list(csv.data['hunger']), [2.0, 2.5])
+
+    # Check that Arrow IPC files and streams are parsed like the same columns in a CSV, and other files are reported
+    @unittest.skipUnless(pyarrow, "requires pyarrow")
+    def test_csv_parsing_arrow(self):
+        args = get_arguments(['-f', 'ex*/my*/dog*', '-c', 'hunger', '--xaxis', 'timestamp'])
+        columns = get_csv_list(args)[0].data
+        table = pyarrow.table(dict(timestamp=columns['timestamp'], hunger=columns['hunger'], weight=np.arange(12)))
+        with tempfile.TemporaryDirectory() as data_dir:
+            for fname, new_writer in (('dog.arrow', pyarrow.ipc.new_file), ('cat.arrows', pyarrow.ipc.new_stream)):
+                with new_writer(os.path.join(data_dir, fname), table.schema) as writer:
+                    writer.write_table(table)
+            args = get_arguments(['-d', data_dir, '-c', 'hung*', '--xaxis', 'timestamp',
+                                  '--col_eq_val', 'weight<6'])
+            csv_list = get_csv_list(args)
+            self.assertEqual([os.path.basename(csv.fname) for csv in csv_list], ['cat.arrows', 'dog.arrow'])
+            for csv in csv_list:
+                self.assertEqual(sorted(csv.data), ['hunger', 'timestamp'])
+                self.assertEqual(list(csv.data['hunger']), list(columns['hunger'][:6]))
+            with open(os.path.join(data_dir, 'old.feather'), 'wb') as feather_file:
+                feather_file.write(b'FEA1' + bytes(64))
+            with self.assertRaises(SystemExit):
+                get_csv_list(get_arguments(['-f', os.path.join(data_dir, 'old.feather'), '-c', 'hunger']))
+
     # Check that the default name generated for a directory is correct
     def test_plotter_default_name_dir(self):
         args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '-n', 'pet_hunger'])
@@ -53,6 +610,12 @@ class TestCSVPlotter(unittest.TestCase):
         plot = Plotter(args, csv_list)
         self.assertEqual(plot.arg['name'], 'my_examples.png')
 
+    # Check that the image format option sets the extension of the generated file
+    def test_plotter_arg_filename_svg(self):
+        args = get_arguments(['-d', 'ex*/my*', '-c', 'hunger', '-I', '--image_format', 'svg'])
+        plot = Plotter(args, get_csv_list(args))
+        self.assertEqual((plot.arg['name'], plot.arg['img']), ('my_examples.svg', 'svg'))
+
 
 if __name__ == '__main__':
     unittest.main()